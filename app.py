@@ -1,6 +1,13 @@
+# Imported first, so that RECON_PROFILE_STARTUP=1 also times the imports below
+from utils.profiling import PROFILE_STARTUP, profiler  # isort: skip
+
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html
+from dash._callback import GLOBAL_CALLBACK_MAP
+
+from utils.metrics import METRICS_ENABLED, instrument_callbacks, register_routes
+from utils.query_data import cache_status, start_warm_up
 
 FA621 = "https://use.fontawesome.com/releases/v6.2.1/css/all.css"
 APP_TITLE = "SWP Delivery Capability Report 2023 Results Console (ReCon)"
@@ -69,5 +76,20 @@ app.layout = html.Div(
 
 server = app.server
 
+if METRICS_ENABLED:
+    # The callbacks of the pages are registered with dash.callback, and are only
+    # moved to app.callback_map on the first request
+    instrument_callbacks([app.callback_map, GLOBAL_CALLBACK_MAP])
+    register_routes(server, cache_status)
+    # Nothing else builds what /ready checks before the first requests, which a
+    # readiness probe holds back
+    start_warm_up()
+
+if PROFILE_STARTUP:
+    # The data and most figures are built later, on first use, and are in the
+    # report printed at exit
+    print("Startup profile (imports):")
+    print(profiler.report())
+
 if __name__ == "__main__":
     app.run_server(debug=True)
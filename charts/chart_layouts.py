@@ -1,3 +1,5 @@
+from typing import Callable
+
 import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.express as px
@@ -6,8 +8,13 @@ from dash import dcc, html
 
 from data import create_download_button
 from pages.styles import PLOT_COLORS
-from utils.query_data import scen_aliases, var_dict
-from utils.tools import cfs_taf, convert_cm_nums, month_list, monthfilter
+from utils.cube import get_cube
+from utils.exceedance import PROBABILITY_GRID, exceedance_curves
+from utils.figure_cache import figure_cache
+from utils.periods import period_averages
+from utils.row_index import get_scenario_partition
+from utils.query_data import get_scen_aliases, var_dict
+from utils.tools import convert_cm_nums, month_list, monthfilter, taf_view
 
 
 INFO_ICON = html.I(className='fa fa-info-circle', style=dict(display='inline-block'))
@@ -24,7 +31,7 @@ class CardWidget:
         button_label2: str | None = None,
         popover_label: str | None = None,
         popover_content: str | None = None,
-        chart: html.Div = None,
+        chart: html.Div | Callable[[], html.Div] = None,
         text=None,
         image=None,
         element_id: str = None,
@@ -43,6 +50,13 @@ class CardWidget:
         self.text = text
         self.image = image
 
+    def get_chart(self) -> html.Div:
+        # Charts can be given as a callable, so they are only built when the card
+        # is first shown, instead of when the page is imported
+        if callable(self.chart):
+            self.chart = self.chart()
+        return self.chart
+
     def create_card(
         self,
         height="35rem",
@@ -51,8 +65,9 @@ class CardWidget:
         endyr=2021,
         registry_id: str | None = None,
     ):
+        chart = self.get_chart()
         if registry_id:
-            download_button = create_download_button(registry_id, self.chart)
+            download_button = create_download_button(registry_id, chart)
         else:
             download_button = None
         card = dbc.Card(
@@ -74,7 +89,7 @@ class CardWidget:
                             if self.popover_label is not None
                             else None
                         ),
-                        self.chart,
+                        chart,
                         (
                             html.P(self.text, className="card-text")
                             if isinstance(self.text, str)
@@ -131,7 +146,8 @@ class CardWidget:
         return card
 
 
-def card_mon_plot(
+@figure_cache(context=get_scen_aliases)
+def card_mon_figure(
     df,
     b_part="C_CAA003",
     yaxis_title=None,
@@ -143,9 +159,8 @@ def card_mon_plot(
     #    df1=df.loc[df['WYT_SAC_'].isin(wyt)]
     # except:
     #    print("WYT_SAC_ timeseries not found")
-    df1 = df.loc[df["WYT_SAC_"].isin(wyt)]
-    df1 = round(df1.groupby(["Scenario", "iwm"]).mean())
-    df1 = df1.reindex(scen_aliases, level="Scenario")
+    df1 = round(get_cube(df, var_dict).wyt_monthly_means(b_part, wyt))
+    df1 = df1.reindex(get_scen_aliases(), level="Scenario")
     fig = px.line(
         df1,
         x=df1.index.get_level_values(1),
@@ -172,11 +187,24 @@ def card_mon_plot(
         xaxis_title="Month",
         yaxis_title=yaxis_title if yaxis_title is not None else b_part,
     )
+    return fig
+
+
+def card_mon_plot(
+    df,
+    b_part="C_CAA003",
+    yaxis_title=None,
+    startyr=1922,
+    endyr=2021,
+    wyt=[1, 2, 3, 4, 5],
+):
+    fig = card_mon_figure(df, b_part, yaxis_title, startyr, endyr, wyt)
     layout = html.Div([dcc.Graph(figure=fig)])
     return layout
 
 
-def card_bar_plot_cy(
+@figure_cache()
+def card_bar_figure_cy(
     df: pd.DataFrame,
     b_part: str = "C_CAA003",
     wyt: list[int] = None,
@@ -185,30 +213,26 @@ def card_bar_plot_cy(
 ):
     if wyt is None:
         wyt = [1, 2, 3, 4, 5]
+    scenarios = get_scenario_partition(df)
+    df = taf_view(df, var_dict, [b_part])
     # This is VERY specific to the DCR 2021
-    df_dcr21 = df.loc[(df["Scenario"].isin(["DCR_21_Hist"])) & (df["icy"] >= startyr)]
-    try:
-        df_dcr21 = cfs_taf(df_dcr21, var_dict)
-    except Exception:
-        print(f"Unable to convert from CFS to TAF for {b_part}")
-    df_dcr21_ann = round(df_dcr21.groupby(["Scenario"]).sum() / (2015 - 1922 + 1))
-    df0 = df.loc[
-        df["Scenario"].isin(
-            [
-                "DCR_23_Adj",
-                "DCR_23_CC50",
-                "DCR_23_CC75",
-                "DCR_23_CC95",
-            ]
-        )
-        & (df["icy"] >= startyr)
-    ]
-    try:
-        df0 = cfs_taf(df0, var_dict)
-    except Exception:
-        print(f"Unable to convert from CFS to TAF for {b_part}")
+    df_dcr21 = scenarios.slice(df, "DCR_21_Hist")
+    df_dcr21 = df_dcr21.loc[df_dcr21["icy"] >= startyr]
+    df_dcr21_ann = round(
+        df_dcr21.groupby(["Scenario"], observed=True).sum() / (2015 - 1922 + 1)
+    )
+    df0 = scenarios.select(
+        df,
+        [
+            "DCR_23_Adj",
+            "DCR_23_CC50",
+            "DCR_23_CC75",
+            "DCR_23_CC95",
+        ],
+    )
+    df0 = df0.loc[df0["icy"] >= startyr]
     # For the last year
-    df1 = round(df0.groupby(["Scenario"]).sum() / (endyr - startyr + 1))
+    df1 = round(df0.groupby(["Scenario"], observed=True).sum() / (endyr - startyr + 1))
     df_plot = pd.concat([df_dcr21_ann, df1])
     fig = px.bar(
         df_plot[b_part],
@@ -227,17 +251,34 @@ def card_bar_plot_cy(
         yaxis_title="",
         xaxis_tickformat=",d",
     )
+    return fig
+
+
+def card_bar_plot_cy(
+    df: pd.DataFrame,
+    b_part: str = "C_CAA003",
+    wyt: list[int] = None,
+    startyr: int = 1922,
+    endyr: int = 2021,
+):
+    fig = card_bar_figure_cy(df, b_part, wyt, startyr, endyr)
     layout = html.Div([dcc.Graph(figure=fig)])
 
     return layout
 
 
-def card_mon_exc_plot(df, b_part, monthchecklist):
+@figure_cache(context=get_scen_aliases)
+def card_mon_exc_figure(df, b_part, monthchecklist):
     fig = mon_exc_plot(df, b_part, monthchecklist)
     fig.update_layout(
         # width=800,
         height=400,
     )
+    return fig
+
+
+def card_mon_exc_plot(df, b_part, monthchecklist):
+    fig = card_mon_exc_figure(df, b_part, monthchecklist)
 
     layout = html.Div(
         [
@@ -254,15 +295,15 @@ def card_mon_exc_plot(df, b_part, monthchecklist):
 
 def ann_bar_plot(df, b_part="C_CAA003", startyr=1922, endyr=2021, wyt=[1, 2, 3, 4, 5]):
 
+    cube = get_cube(df, var_dict)
     try:
-        df0 = df.loc[df["WYT_SAC_"].isin(wyt)]
+        selected = cube.wyt_mask(wyt)
     except KeyError as e:
         print(e)
 
-    df0 = cfs_taf(df0, var_dict)
-
-    df1 = round(df0.groupby(["Scenario"]).sum() / (endyr - startyr + 1))
-    df1 = df1.reindex(scen_aliases, level="Scenario")
+    df1 = cube.sum(selected, taf=True, variables=[b_part])
+    df1 = round(df1 / (endyr - startyr + 1))
+    df1 = df1.reindex(get_scen_aliases())
     fig = px.bar(
         df1,
         x=df1.index.get_level_values(0),
@@ -280,35 +321,22 @@ def ann_bar_plot(df, b_part="C_CAA003", startyr=1922, endyr=2021, wyt=[1, 2, 3,
     return fig
 
 
-def mon_exc_plot(df, b_part, monthchecklist):
-    series_container = []
-    # Filter the calendar months
-    df0 = df.loc[df["icm"].isin(convert_cm_nums(monthchecklist))]
-    for scenario in scen_aliases:
-        series_i = df0.loc[df0["Scenario"] == scenario, b_part]
-        series_i = series_i.sort_values()
-        series_i = series_i.reset_index(drop=True)
-        series_i.rename(scenario, inplace=True)
-        series_container.append(series_i)
-
-    df3 = pd.concat(series_container, axis=1)
+def mon_exc_plot(df, b_part, monthchecklist, probs=None):
+    probs = PROBABILITY_GRID if probs is None else probs
+    # Merge the presorted values of the calendar months
+    cube = get_cube(df, var_dict)
+    values = cube.sorted_months(b_part, convert_cm_nums(monthchecklist))
+    scenarios = get_scen_aliases()
+    curves = exceedance_curves(
+        cube.scenario_rows(scenarios, values), probs, presorted=True
+    )
     fig = go.Figure()
 
-    for i, column in enumerate(df3.columns):
-        series_sorted = df3[column].dropna()
-        exceedance_prob = (series_sorted.index + 1) / len(series_sorted) * 100
-        # linearly interpolate the line above so we get 100 points, from 1-100
-        df = pd.DataFrame(data={"y": series_sorted, "x": exceedance_prob})
-        integer_index = df["x"].round(decimals=0).astype(int)
-        # This step should really be an interpolation using scipy.interp1d, but it works
-        # with the dependencies that we have right now
-        # TODO: 2024-07-18 Consider updating to an interpolation method
-        df = df.groupby(integer_index).mean()
-        df = df.reindex(index=range(1, 101, 1)).ffill()
+    for i, column in enumerate(scenarios):
         fig.add_trace(
             go.Scatter(
-                x=df.index,
-                y=df["y"],
+                x=probs,
+                y=curves[i],
                 mode="lines",
                 name=column,
                 line=dict(color=PLOT_COLORS[i % len(PLOT_COLORS)]),
@@ -334,43 +362,27 @@ def ann_exc_plot(df,
                  monthchecklist,
                  yearwindow,
                  title: str = None,
+                 probs=None,
 ):
-    series_container = []
+    probs = PROBABILITY_GRID if probs is None else probs
     if yearwindow == "Calendar Year":
         yw = "icy"
     else:
         yw = "iwy"
 
-    df0 = df.loc[df["icm"].isin(convert_cm_nums(monthchecklist))]
-    df0 = cfs_taf(df0, var_dict)
-    df0 = df0.groupby(["Scenario", yw]).sum()
-
-    for scenario in scen_aliases:
-        series_i = df0.loc[df0.index.get_level_values(0) == scenario, b_part]
-        series_i = series_i.sort_values()
-        series_i = series_i.reset_index(drop=True)
-        series_i.rename(scenario, inplace=True)
-        series_container.append(series_i)
-
-    df3 = pd.concat(series_container, axis=1)
+    cube = get_cube(df, var_dict)
+    _, totals = cube.annual_totals(
+        b_part, yw, convert_cm_nums(monthchecklist), taf=True
+    )
+    scenarios = get_scen_aliases()
+    curves = exceedance_curves(cube.scenario_rows(scenarios, totals), probs)
     fig1 = go.Figure()
 
-    for i, column in enumerate(df3.columns):
-        series_sorted = df3[column].dropna()
-        exceedance_prob = (series_sorted.index + 1) / len(series_sorted) * 100
-        # linearly interpolate the line above so we get 100 points, from 1-100
-        df = pd.DataFrame(data={"y": series_sorted, "x": exceedance_prob})
-        integer_index = df["x"].round(decimals=0).astype(int)
-        # This step should really be an interpolation using scipy.interp1d, but it works
-        # with the dependencies that we have right now
-        # TODO: 2024-07-18 Consider updating to an interpolation method
-        df = df.groupby(integer_index).mean()
-        df = df.reindex(index=range(1, 101, 1)).ffill()
-
+    for i, column in enumerate(scenarios):
         fig1.add_trace(
             go.Scatter(
-                x=df.index,
-                y=df["y"],
+                x=probs,
+                y=curves[i],
                 mode="lines",
                 name=column,
                 line=dict(color=PLOT_COLORS[i % len(PLOT_COLORS)]),
@@ -400,12 +412,11 @@ def distplot(
         ylabel: str = None,
 ):
     df2 = pd.DataFrame()
-    df0 = df
-    df0 = cfs_taf(df0, var_dict)
-    df0 = df0.groupby(["Scenario", "iwy"]).sum()
+    scenarios = get_scenario_partition(df)
+    df0 = taf_view(df, var_dict, [b_part])
 
-    for scenario in scen_aliases:
-        df1 = df0.loc[df0.index.get_level_values(0) == scenario, b_part]
+    for scenario in get_scen_aliases():
+        df1 = scenarios.slice(df0, scenario).groupby("iwy")[b_part].sum()
         df1 = df1.reset_index(drop=True)
         df2[scenario] = df1
 
@@ -426,32 +437,28 @@ def distplot(
     )
 
     fig.for_each_trace(lambda trace: trace.update(visible='legendonly')
-                       if trace.name in scen_aliases[-4:] else ()
+                       if trace.name in get_scen_aliases()[-4:] else ()
     )
 
     return fig
 
 
+@figure_cache()
 def ta_dry_wet_barplot(
     df, common_pers, bpart="SWP_TA_CO_SOD", scens=None, ta_tot=4133, perlist=None
 ):
-    df1 = pd.DataFrame()
-    df = cfs_taf(df, var_dict)
+    periods = {c: p for c, p in common_pers.items() if c in perlist}
+    avgs = period_averages(df, var_dict, bpart, periods)
     left = {"scenario": [], "period": [], "avg": [], "pct": [], "label": []}
     l_df = pd.DataFrame()
     for s in scens:
-        for c in common_pers:
-            if c in perlist:
-                startyr = int(common_pers[c].split("-")[0])
-                endyr = int(common_pers[c].split("-")[-1])
-                df1 = df.loc[df["Scenario"] == s, [bpart, "icy"]]
-                df2 = df1.loc[df1["icy"].between(startyr, endyr)]
-                v = round(df2[bpart].sum() / (endyr - startyr + 1), 0)
-                left["scenario"].append(s)
-                left["period"].append(c)
-                left["avg"].append(v)
-                left["pct"].append(round((v / ta_tot), 2))
-                left["label"].append(f"{round((v/ta_tot)*100)}%")
+        for c in periods:
+            v = round(avgs.at[s, c], 0) if s in avgs.index else 0.0
+            left["scenario"].append(s)
+            left["period"].append(c)
+            left["avg"].append(v)
+            left["pct"].append(round((v / ta_tot), 2))
+            left["label"].append(f"{round((v/ta_tot)*100)}%")
     l_df = pd.DataFrame(left)
     # print(l_df)
     fig = px.bar(
@@ -483,6 +490,7 @@ def ta_dry_wet_barplot(
     return fig
 
 
+@figure_cache()
 def a21_dry_wet_barplot(
     df,
     common_pers,
@@ -490,21 +498,16 @@ def a21_dry_wet_barplot(
     scens=None,
     perlist=None,
 ):
-    df1 = pd.DataFrame()
-    df = cfs_taf(df, var_dict)
+    periods = {c: p for c, p in common_pers.items() if c in perlist}
+    avgs = period_averages(df, var_dict, bpart, periods)
     left = {"scenario": [], "period": [], "avg": []}
     l_df = pd.DataFrame()
     for s in scens:
-        for c in common_pers:
-            if c in perlist:
-                startyr = int(common_pers[c].split("-")[0])
-                endyr = int(common_pers[c].split("-")[-1])
-                df1 = df.loc[df["Scenario"] == s, [bpart, "icy"]]
-                df2 = df1.loc[df1["icy"].between(startyr, endyr)]
-                v = round(df2[bpart].sum() / (endyr - startyr + 1), 0)
-                left["scenario"].append(s)
-                left["period"].append(c)
-                left["avg"].append(v)
+        for c in periods:
+            v = round(avgs.at[s, c], 0) if s in avgs.index else 0.0
+            left["scenario"].append(s)
+            left["period"].append(c)
+            left["avg"].append(v)
     l_df = pd.DataFrame(left)
     # print(l_df)
     fig = px.bar(
@@ -3,7 +3,7 @@ from dash import Input, Output, callback, dcc, html, register_page
 
 from charts.chart_layouts import a21_dry_wet_barplot
 from data import create_download_button, universal_data_download
-from utils.query_data import df_dv, scen_aliases
+from utils.query_data import get_dv, get_scen_aliases
 from utils.tools import common_pers
 
 register_page(
@@ -46,19 +46,19 @@ def layout():
     ]
 
     dry_pers = a21_dry_wet_barplot(
-        df_dv,
+        get_dv(),
         common_pers,
         bpart="SWP_IN_TOTAL",
-        scens=scen_aliases,
+        scens=get_scen_aliases(),
         perlist=drypers,
     )
 
     button_download_dry = create_download_button(DWNLD_DRY_ID, dry_pers)
     wet_pers = a21_dry_wet_barplot(
-        df_dv,
+        get_dv(),
         common_pers,
         bpart="SWP_IN_TOTAL",
-        scens=scen_aliases,
+        scens=get_scen_aliases(),
         perlist=wetpers,
     )
 
@@ -15,7 +15,8 @@ from dash import (
 from charts.chart_layouts import ann_exc_plot, distplot
 from data import create_download_button, universal_data_download
 from data.downloads import CHART_REGISTRY
-from utils.query_data import df_dv, scen_aliases, var_dict
+from utils.periods import get_period_table
+from utils.query_data import get_dv, get_scen_aliases, var_dict
 from utils.tools import common_pers, make_summary_df, month_list
 
 register_page(
@@ -49,15 +50,6 @@ table_order = [
     {"name": "B-Part", "id": "bpart"},
 ]
 
-# Scenarios go next
-table_order.extend(
-    [
-        {"name": s, "id": s, "type": "numeric", "format": {"specifier": ",.0f"}}
-        for s in scen_aliases
-        if s not in ["description", "index", "type"]
-    ]
-)
-
 typefilter_dict = {
     "table_a_btn": "Delivery - TA",
     "a21_btn": "Delivery - IN",
@@ -67,22 +59,25 @@ typefilter_dict = {
 opt = [{"label": k, "value": v} for k, v in common_pers.items()]
 
 DWNLD_BUTTON_ID = "contractor-specific-exceedance"
+DWNLD_PERIODS_ID = "contractor-period-averages"
 
 
 def layout(**kwargs):
     global b
     global exp_tbl
-    b = []
     s = str(kwargs.get("type", "table_a_btn"))
     typefilter = typefilter_dict[s]
-
-    for i in var_dict:
-        if var_dict[i]["type"] == typefilter:
-            b.append(i)
+    b = list(var_dict.by_type.get(typefilter, []))
     exp_tbl = make_summary_df(
-        scen_aliases, df_dv, var_dict, bparts=b,
+        get_scen_aliases(), get_dv(), var_dict, bparts=b,
         yrkind='icy', start_yr=1922, end_yr=2021
     )
+    # Scenarios go next
+    columns = table_order + [
+        {"name": s, "id": s, "type": "numeric", "format": {"specifier": ",.0f"}}
+        for s in get_scen_aliases()
+        if s not in ["description", "index", "type"]
+    ]
     graph_div = dcc.Graph(id="contractor-exceedance-graph")
     distplot_div = dcc.Graph(id="contractor-dist-plot")
 
@@ -90,6 +85,7 @@ def layout(**kwargs):
         class_name="my-y",
         children=[
             dcc.Download(id="download-response-contractor"),
+            dcc.Download(id="download-response-periods"),
             html.H1(["Contractor Summary"]),
             html.A(contractor_summary_text),
             # dcc.Markdown("# ![](/assets/cs3_icon_draft.png) CalSim 3 Summary Table"),
@@ -108,12 +104,18 @@ def layout(**kwargs):
                 placeholder="Select the Averaging Period (Contract Years)",
             ),
             html.Div(id="output-container-range-slider_2"),
+            html.Div(
+                className="m-3",
+                children=dbc.Button(
+                    "Download Averages for All Periods", id=DWNLD_PERIODS_ID
+                ),
+            ),
             dbc.Row(
                 [
                     dcc.Markdown("#### "),
                     dash_table.DataTable(
                         id="exp_tbl",
-                        columns=table_order,
+                        columns=columns,
                         data=exp_tbl.to_dict(orient="records"),
                         style_header={
                             "backgroundColor": "rgb(200, 200, 200)",
@@ -146,8 +148,8 @@ def layout(**kwargs):
 )
 def update_table(slider_yr_range):
     df_tbl = make_summary_df(
-        scen_aliases,
-        df_dv,
+        get_scen_aliases(),
+        get_dv(),
         var_dict,
         bparts=b,
         yrkind='icy',
@@ -193,7 +195,7 @@ def show_contractor_data(click_data):
     else:
         b = exp_tbl.loc[click_data["row"]]["bpart"]
         fig = ann_exc_plot(
-            df_dv,
+            get_dv(),
             b,
             monthchecklist=month_list,
             yearwindow="Calendar Year",
@@ -214,7 +216,7 @@ def show_contractor_distplot(click_data):
         return "Click on a cell"
     else:
         b = exp_tbl.loc[click_data["row"]]["bpart"]
-        fig = distplot(df_dv, b,
+        fig = distplot(get_dv(), b,
                        xlabel="Annual Average (TAF/yr)",
                        ylabel="Count",
                        title=b)
@@ -233,3 +235,13 @@ def contractor_data_download(inputs, state):
     else:
         b = exp_tbl.loc[state["row"]]["bpart"]
     return universal_data_download(csv_name=f"exceedance-{b}.csv")
+
+
+@callback(
+    Output("download-response-periods", "data"),
+    Input(DWNLD_PERIODS_ID, "n_clicks"),
+    prevent_initial_call=True,
+)
+def period_table_download(n_clicks):
+    table = get_period_table(get_dv(), var_dict, common_pers).to_frame()
+    return dcc.send_data_frame(table.to_csv, "period-averages.csv", index=False)
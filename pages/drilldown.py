@@ -8,9 +8,11 @@ from dash import Input, Output, State, callback, dcc, html, register_page
 
 from charts.chart_layouts import ann_exc_plot, mon_exc_plot
 from pages.styles import PLOT_COLORS
-from utils.query_data import date_map, df_dv, scen_aliases, var_dict
+from utils.cube import get_cube
+from utils.query_data import date_map, get_dv, get_scen_aliases, var_dict
+from utils.row_index import get_row_index
+from utils.search import CatalogSearch
 from utils.tools import (
-    cfs_taf,
     convert_wyt_nums,
     list_files,
     load_data_mult,
@@ -19,6 +21,7 @@ from utils.tools import (
     month_list,
     monthfilter,
     month_map,
+    taf_view,
     wyt_list,
 )
 
@@ -49,23 +52,30 @@ drilldown_text = (
     html.Br(),
 )
 
-bparts = []
-aliases = []
+# The dropdowns only get the options matching what the user types, so the page
+# doesn't grow with the catalog
+catalog_search = CatalogSearch(var_dict)
+SEARCH_LIMIT = 50
 
-for var in var_dict:
-    bparts.append(var)
-    aliases.append(var_dict[var]["alias"])
 
+def bpart_option(b: str) -> dict:
+    entry = var_dict[b]
+    return {"label": b, "value": b, "search": f"{b} {entry.alias} {entry.type}"}
+
+
+def alias_option(b: str) -> dict:
+    entry = var_dict[b]
+    return {
+        "label": entry.alias,
+        "value": entry.alias,
+        "search": f"{entry.alias} {b} {entry.type}",
+    }
 
-# DataFrames for the summary tables
-df_tbl = make_summary_df(scen_aliases, df_dv, var_dict)
-df_tbl_res = make_ressum_df(scen_aliases, df_dv, var_dict)
 
 
 # Layout Starts Here
 def layout(**kwargs):
     b = kwargs.get("type", "C_CAA003")
-    print(b)
     layout = dbc.Container(
         class_name="my-3",
         children=[
@@ -77,13 +87,18 @@ def layout(**kwargs):
                         [
                             "Select B-Part: ",
                             dcc.Dropdown(
-                                bparts, id="b-part", value=b, style={"width": "100%"}
+                                [bpart_option(b)],
+                                id="b-part",
+                                value=b,
+                                placeholder="Type to search",
+                                style={"width": "100%"},
                             ),
                             "Or search by alias: ",
                             dcc.Dropdown(
-                                options=aliases,
+                                options=[alias_option(b)],
                                 id="alias",
                                 value=var_dict[b]["alias"],
+                                placeholder="Type to search",
                                 style={"width": "100%"},
                             ),
                         ],
@@ -214,15 +229,43 @@ def layout(**kwargs):
 # CALLBACKS Start Here
 
 
+# Search the catalog as the user types
+@callback(
+    Output(component_id="b-part", component_property="options"),
+    Input(component_id="b-part", component_property="search_value"),
+    Input(component_id="b-part", component_property="value"),
+)
+def search_b_part(search_value, value):
+    matches = catalog_search.search(search_value or "", SEARCH_LIMIT)
+    if value in var_dict and value not in matches:
+        matches.insert(0, value)
+    return [bpart_option(b) for b in matches]
+
+
+@callback(
+    Output(component_id="alias", component_property="options"),
+    Input(component_id="alias", component_property="search_value"),
+    Input(component_id="alias", component_property="value"),
+)
+def search_alias(search_value, value):
+    matches = catalog_search.search(search_value or "", SEARCH_LIMIT)
+    b = var_dict.alias_to_bpart.get(value)
+    if b is not None:
+        matches.insert(0, b)
+    # Several variables can share an alias
+    options = {}
+    for b in matches:
+        options.setdefault(var_dict[b].alias, alias_option(b))
+    return list(options.values())
+
+
 # Return B Part based on alias search
 @callback(
     Output(component_id="b-part", component_property="value"),
     Input(component_id="alias", component_property="value"),
 )
 def update_b_part(alias):
-    i = aliases.index(str(alias))
-    b = bparts[i]
-    return b
+    return var_dict.alias_to_bpart[str(alias)]
 
 
 # Timeseries Plot
@@ -231,6 +274,7 @@ def update_b_part(alias):
     Input(component_id="b-part", component_property="value"),
 )
 def update_timeseries(b_part):
+    df_dv = get_dv()
     fig = px.line(
         df_dv,
         x=df_dv.index,
@@ -262,9 +306,10 @@ def update_annual_timeseries(
         "Calendar Year": 1,
         "Water Year": 10,
     }
+    df_dv = get_dv()
     df_agg = (
         df_dv.loc[:, [b_part, "Scenario"]]
-        .groupby("Scenario")
+        .groupby("Scenario", observed=True)
         .resample(rule=pd.offsets.YearBegin(month=offsets[year_type]))
         .agg({b_part: [agg_method.lower(), "count"]})
         .reset_index()
@@ -296,7 +341,7 @@ def update_annual_timeseries(
     Input(component_id="monthchecklist-exc", component_property="value"),
 )
 def update_exceedance(b_part, monthchecklist):
-    fig = mon_exc_plot(df_dv, b_part, monthchecklist)
+    fig = mon_exc_plot(get_dv(), b_part, monthchecklist)
     return fig
 
 
@@ -308,7 +353,7 @@ def update_exceedance(b_part, monthchecklist):
     Input(component_id="yearwindow", component_property="value"),
 )
 def update_exceedance(b_part, monthchecklist, yearwindow):
-    fig = ann_exc_plot(df_dv, b_part, monthchecklist, yearwindow)
+    fig = ann_exc_plot(get_dv(), b_part, monthchecklist, yearwindow)
     return fig
 
 
@@ -322,13 +367,11 @@ def update_exceedance(b_part, monthchecklist, yearwindow):
 def update_monthly(b_part, wytchecklist, slider_yr_range):
     startyr = slider_yr_range[0]
     endyr = slider_yr_range[1]
-    df0 = df_dv.loc[
-        df_dv["WYT_SAC_"].isin(convert_wyt_nums(wytchecklist))
-        & (df_dv["iwy"] >= startyr)
-        & (df_dv["iwy"] <= endyr)
-    ]
-    df1 = round(df0.groupby(["Scenario", "iwm"]).mean())
-    df1 = df1.reindex(scen_aliases, level="Scenario")
+    cube = get_cube(get_dv(), var_dict)
+    df1 = cube.wyt_monthly_means(
+        b_part, convert_wyt_nums(wytchecklist), startyr, endyr
+    )
+    df1 = round(df1).reindex(get_scen_aliases(), level="Scenario")
     fig = px.line(
         df1,
         x=df1.index.get_level_values(1),
@@ -367,17 +410,14 @@ def update_monthly(b_part, wytchecklist, slider_yr_range):
 def update_bar_annual(b_part, wytchecklist, slider_yr_range):
     startyr = slider_yr_range[0]
     endyr = slider_yr_range[1]
-    print(wytchecklist)
-    df1 = df_dv.loc[
-        df_dv["WYT_SAC_"].isin(convert_wyt_nums(wytchecklist))
-        & (df_dv["iwy"] >= startyr)
-        & (df_dv["iwy"] <= endyr)
-    ]
-
-    df1 = cfs_taf(df1, var_dict)
+    df_dv = get_dv()
+    rows = get_row_index(df_dv).rows(
+        wyt=convert_wyt_nums(wytchecklist), start_yr=startyr, end_yr=endyr
+    )
+    df1 = taf_view(df_dv, var_dict, [b_part]).iloc[rows]
 
-    df2 = round(df1.groupby(["Scenario"]).sum() / (endyr - startyr + 1))
-    df2 = df2.reindex(scen_aliases, level="Scenario")
+    df2 = round(df1.groupby(["Scenario"], observed=True).sum() / (endyr - startyr + 1))
+    df2 = df2.reindex(get_scen_aliases())
     fig = px.bar(
         df2,
         x=df2.index.get_level_values(0),
@@ -405,8 +445,8 @@ def update_table(slider_yr_range, monthchecklist):
         monthfilter.append(month_map[v])
 
     df_tbl = make_summary_df(
-        scen_aliases,
-        df_dv,
+        get_scen_aliases(),
+        get_dv(),
         var_dict,
         start_yr=slider_yr_range[0],
         end_yr=slider_yr_range[1],
@@ -426,8 +466,8 @@ def update_table2(slider_yr_range, monthradio):
     monthradio = [month_map[monthradio]]
 
     df_tbl = make_ressum_df(
-        scen_aliases,
-        df_dv,
+        get_scen_aliases(),
+        get_dv(),
         var_dict,
         start_yr=slider_yr_range[0],
         end_yr=slider_yr_range[1],
@@ -1,9 +1,11 @@
+from functools import cache
+
 import dash_bootstrap_components as dbc
 from dash import Input, Output, callback, dcc, html, register_page
 
 from charts.chart_layouts import ta_dry_wet_barplot
 from data import create_download_button, load_markdown, universal_data_download
-from utils.query_data import df_dv, scen_aliases
+from utils.query_data import get_dv, get_scen_aliases
 from utils.tools import common_pers
 
 register_page(
@@ -46,26 +48,32 @@ ta_periods_text = dbc.Row(
     class_name="m-3",
 )
 
-dry_pers = ta_dry_wet_barplot(
-    df_dv,
-    common_pers,
-    bpart="SWP_TA_CO_SOD",
-    scens=scen_aliases,
-    perlist=drypers,
-)
-wet_pers = ta_dry_wet_barplot(
-    df_dv,
-    common_pers,
-    bpart="SWP_TA_CO_SOD",
-    scens=scen_aliases,
-    perlist=wetpers,
-)
+
+@cache
+def period_figures():
+    dry_pers = ta_dry_wet_barplot(
+        get_dv(),
+        common_pers,
+        bpart="SWP_TA_CO_SOD",
+        scens=get_scen_aliases(),
+        perlist=drypers,
+    )
+    wet_pers = ta_dry_wet_barplot(
+        get_dv(),
+        common_pers,
+        bpart="SWP_TA_CO_SOD",
+        scens=get_scen_aliases(),
+        perlist=wetpers,
+    )
+    return dry_pers, wet_pers
+
 
 DWNLD_DRY_ID = "table-a-dry-years"
 DWNLD_WET_ID = "table-a-wet-years"
 
 
 def layout():
+    dry_pers, wet_pers = period_figures()
     layout = dbc.Container(
         class_name="my-3",
         children=[
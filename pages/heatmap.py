@@ -4,7 +4,9 @@ import plotly.express as px
 from dash import Dash, Input, Output, callback, dash_table, dcc, html, register_page
 
 from charts.chart_layouts import ann_bar_plot, mon_exc_plot
-from utils.query_data import df_dv, scen_aliases, var_dict
+from utils.catalog import as_catalog
+from utils.query_data import get_dv, get_scen_aliases, var_dict
+from utils.row_index import get_row_index
 from utils.tools import convert_cm_nums, convert_wyt_nums, month_list, wyt_list
 
 # Remove heatmap
@@ -29,22 +31,19 @@ def make_heatmap_df(
 
     # df0=df.loc[df['WYT_SAC_'].isin(convert_wyt_nums(wytchecklist))]
 
-    # Do Filters
-    df1 = df.loc[
-        (df["icm"].isin(monthfilter))  # Filter cal months
-        & (df["iwy"] >= start_yr)
-        & (df["iwy"] <= end_yr)  # Filter Start/End Year
-        & df["WYT_SAC_"].isin(wytfilter)  # Filter Water Year Type (SVI)
-    ]
+    # Do Filters: calendar months, start/end year and water year type (SVI)
+    rows = get_row_index(df).rows(
+        months=monthfilter, wyt=wytfilter, start_yr=start_yr, end_yr=end_yr
+    )
+    df1 = df.iloc[rows]
 
-    for var in var_dict:
-        if var_dict[var]["table_convert"] == "cfs_taf":
-            df1[var] = df1[var] * df1["cfs_taf"]
-        else:
-            continue
+    for var in as_catalog(var_dict).by_convert.get("cfs_taf", []):
+        df1[var] = df1[var] * df1["cfs_taf"]
 
     # Annual Average
-    df_tbl = round(df1.groupby(["Scenario"]).sum() / (end_yr - start_yr + 1))
+    df_tbl = round(
+        df1.groupby(["Scenario"], observed=True).sum() / (end_yr - start_yr + 1)
+    )
 
     df_tbl = (df_tbl - df_tbl.iloc[0]) / df_tbl.iloc[0]
     df_tbl = df_tbl[df_tbl.index.isin(scen_aliases)]
@@ -56,13 +55,6 @@ def make_heatmap_df(
         df1 = df_tbl.loc[:, bparts]
         df_tbl = df1
 
-    # Make a dictionary of just aliases to map to the dataframe
-    alias_dict = {}
-    type_dict = {}
-    for key in var_dict:
-        alias_dict[key] = var_dict[key]["alias"]
-        type_dict[key] = var_dict[key]["type"]
-
     return df_tbl
 
 
@@ -201,12 +193,11 @@ layout()
 def filter_heatmap(cols, slider_yr_range, monthchecklist, wytchecklist):
     start_yr = slider_yr_range[0]
     end_yr = slider_yr_range[1]
-    print(wytchecklist)
     monthfilter = convert_cm_nums(monthchecklist)
     wytfilter = convert_wyt_nums(wytchecklist)
     df_hm = make_heatmap_df(
-        scen_aliases,
-        df_dv,
+        get_scen_aliases(),
+        get_dv(),
         var_dict,
         start_yr=start_yr,
         end_yr=end_yr,
@@ -243,7 +234,7 @@ def show_ann_bar(clickData):
     point = clickData["points"][0]
     x = point["x"]
     value = {var_dict[x]["alias"]}
-    return ann_bar_plot(df_dv, b_part=x)
+    return ann_bar_plot(get_dv(), b_part=x)
 
 
 @callback(
@@ -260,7 +251,7 @@ def show_mon_exc(clickData, monthchecklist):
     point = clickData["points"][0]
     x = point["x"]
     value = {var_dict[x]["alias"]}
-    return mon_exc_plot(df_dv, b_part=x, monthchecklist=monthchecklist)
+    return mon_exc_plot(get_dv(), b_part=x, monthchecklist=monthchecklist)
 
 
 # mon_exc_plot(b_part="C_CAA003",monthchecklist=["Oct"])
@@ -14,7 +14,7 @@ from dash import (
 
 from charts.chart_layouts import CardWidget, card_bar_plot_cy, card_mon_exc_plot
 from data import load_markdown, universal_data_download
-from utils.query_data import df_dv
+from utils.query_data import get_dv
 
 INFO_ICON = html.I(className='fa fa-info-circle', style=dict(display='inline-block'))
 
@@ -38,7 +38,7 @@ ta_card = CardWidget(
     button_label2="Wet and Dry Periods",
     popover_label="table-a-info",
     popover_content=load_markdown("page_text/info-table-a.md"),
-    chart=card_bar_plot_cy(df_dv, b_part="SWP_TA_CO_SOD"),
+    chart=lambda: card_bar_plot_cy(get_dv(), b_part="SWP_TA_CO_SOD"),
     text=None,
 )
 a21_card = CardWidget(
@@ -47,7 +47,7 @@ a21_card = CardWidget(
     button_label="View by Contractor",
     popover_label="a21-info",
     popover_content=load_markdown("page_text/info-article-21.md"),
-    chart=card_bar_plot_cy(df_dv, b_part="SWP_IN_TOTAL"),
+    chart=lambda: card_bar_plot_cy(get_dv(), b_part="SWP_IN_TOTAL"),
     text=None,
 )
 a56_card = CardWidget(
@@ -56,7 +56,7 @@ a56_card = CardWidget(
     button_label="View by Contractor",
     popover_label="a56-info",
     popover_content=load_markdown("page_text/info-carryover.md"),
-    chart=card_bar_plot_cy(df_dv, b_part="SWP_CO_SOD"),
+    chart=lambda: card_bar_plot_cy(get_dv(), b_part="SWP_CO_SOD"),
     text=None,
 )
 exp_card = CardWidget(
@@ -65,31 +65,35 @@ exp_card = CardWidget(
     button_label="Details",
     popover_label="exp-info",
     popover_content=load_markdown("page_text/info-swp-exports.md"),
-    chart=card_bar_plot_cy(df_dv, b_part="C_CAA003_SWP"),
+    chart=lambda: card_bar_plot_cy(get_dv(), b_part="C_CAA003_SWP"),
 )
 orovl_sep_card = CardWidget(
     "Oroville End-of-September Storage",
     button_id="S_OROVL",
     button_label="Details",
-    chart=card_mon_exc_plot(df_dv, b_part="S_OROVL", monthchecklist=["Sep"]),
+    chart=lambda: card_mon_exc_plot(get_dv(), b_part="S_OROVL", monthchecklist=["Sep"]),
 )
 orovl_may_card = CardWidget(
     "Oroville End-of-May Storage",
     button_id="S_OROVL",
     button_label="Details",
-    chart=card_mon_exc_plot(df_dv, b_part="S_OROVL", monthchecklist=["May"]),
+    chart=lambda: card_mon_exc_plot(get_dv(), b_part="S_OROVL", monthchecklist=["May"]),
 )
 sluis_card = CardWidget(
     "San Luis SWP End-of-September Storage",
     button_id="S_SLUIS_SWP",
     button_label="Details",
-    chart=card_mon_exc_plot(df_dv, b_part="S_SLUIS_SWP", monthchecklist=["Sep"]),
+    chart=lambda: card_mon_exc_plot(
+        get_dv(), b_part="S_SLUIS_SWP", monthchecklist=["Sep"]
+    ),
 )
 swp_alloc_card = CardWidget(
     "SWP May Allocation",
     button_id=None,
     button_label=None,
-    chart=card_mon_exc_plot(df_dv, b_part="PERDV_SWP_MWD1", monthchecklist=["May"]),
+    chart=lambda: card_mon_exc_plot(
+        get_dv(), b_part="PERDV_SWP_MWD1", monthchecklist=["May"]
+    ),
 )
 
 add_resources_card = dbc.Card(
@@ -326,8 +330,6 @@ def button_1_action(n_clicks):
         button_index = eval(button_id)["index"]
         url_params = urlencode({"type": button_index})
 
-        print(button_index)
-
         if button_index == "ta_wet_dry":
             return "/dry_wet_periods", True
 
@@ -3,7 +3,7 @@ from dash import Input, Output, callback, dcc, html, register_page
 
 from charts.chart_layouts import CardWidget, card_bar_plot_cy, card_mon_plot
 from data import load_markdown, universal_data_download
-from utils.query_data import df_sv
+from utils.query_data import get_sv
 
 register_page(
     __name__,
@@ -32,7 +32,7 @@ eight_ri_card_ann = CardWidget(
     "Eight River Index",
     button_id=None,
     button_label=None,
-    chart=card_bar_plot_cy(df_sv, b_part="8RI"),
+    chart=lambda: card_bar_plot_cy(get_sv(), b_part="8RI"),
     text=load_markdown("page_text/hydrology-8ri.md"),
 )
 
@@ -40,7 +40,7 @@ sac_four_ri_card_ann = CardWidget(
     "Sacramento River Runoff",
     button_id=None,
     button_label=None,
-    chart=card_bar_plot_cy(df_sv, b_part="SAC4"),
+    chart=lambda: card_bar_plot_cy(get_sv(), b_part="SAC4"),
     text=load_markdown("page_text/hydrology-sacramento-4ri.md"),
 )
 
@@ -48,7 +48,7 @@ sjr_four_ri_card_ann = CardWidget(
     "San Joaquin River Runoff",
     button_id=None,
     button_label=None,
-    chart=card_bar_plot_cy(df_sv, b_part="SJR4"),
+    chart=lambda: card_bar_plot_cy(get_sv(), b_part="SJR4"),
     text=load_markdown("page_text/hydrology-san-joaquin-4ri.md"),
 )
 
@@ -56,7 +56,7 @@ orov_inflow_card_ann = CardWidget(
     "Oroville Reservoir Inflow",
     button_id=None,
     button_label=None,
-    chart=card_bar_plot_cy(df_sv, b_part="OROVI"),
+    chart=lambda: card_bar_plot_cy(get_sv(), b_part="OROVI"),
     text="",
 )
 
@@ -64,7 +64,9 @@ eight_ri_card_mon = CardWidget(
     "Eight River Index",
     button_id=None,
     button_label=None,
-    chart=card_mon_plot(df_sv, b_part="8RI", yaxis_title="Eight River Index (TAF)"),
+    chart=lambda: card_mon_plot(
+        get_sv(), b_part="8RI", yaxis_title="Eight River Index (TAF)"
+    ),
     text="",
 )
 
@@ -72,8 +74,8 @@ sac_four_ri_card_mon = CardWidget(
     "Sacramento River Runoff",
     button_id=None,
     button_label=None,
-    chart=card_mon_plot(
-        df_sv, b_part="SAC4", yaxis_title="Sacramento River Runoff (TAF)"
+    chart=lambda: card_mon_plot(
+        get_sv(), b_part="SAC4", yaxis_title="Sacramento River Runoff (TAF)"
     ),
     text="",
 )
@@ -82,8 +84,8 @@ sjr_four_ri_card_mon = CardWidget(
     "San Joaquin River Runoff",
     button_id=None,
     button_label=None,
-    chart=card_mon_plot(
-        df_sv, b_part="SJR4", yaxis_title="San Joaquin River Runoff (TAF)"
+    chart=lambda: card_mon_plot(
+        get_sv(), b_part="SJR4", yaxis_title="San Joaquin River Runoff (TAF)"
     ),
     text="",
 )
@@ -92,8 +94,8 @@ orov_inflow_card_mon = CardWidget(
     "Oroville Reservoir Inflow - All Years",
     button_id=None,
     button_label=None,
-    chart=card_mon_plot(
-        df_sv,
+    chart=lambda: card_mon_plot(
+        get_sv(),
         b_part="OROVI",
         wyt=[1, 2, 3, 4, 5],
         yaxis_title="Oroville Reservoir Inflow (TAF)",
@@ -105,8 +107,11 @@ orov_inflow_card_drier_mon = CardWidget(
     "Oroville Reservoir Inflow - Drier Years",
     button_id=None,
     button_label=None,
-    chart=card_mon_plot(
-        df_sv, b_part="OROVI", wyt=[4, 5], yaxis_title="Oroville Reservoir Inflow (TAF)"
+    chart=lambda: card_mon_plot(
+        get_sv(),
+        b_part="OROVI",
+        wyt=[4, 5],
+        yaxis_title="Oroville Reservoir Inflow (TAF)",
     ),
     text="""Dry and Critical years (Sacramento Valley Index)""",
 )
@@ -115,8 +120,11 @@ orov_inflow_card_wetter_mon = CardWidget(
     "Oroville Reservoir Inflow - Wetter Years",
     button_id=None,
     button_label=None,
-    chart=card_mon_plot(
-        df_sv, b_part="OROVI", wyt=[1, 2], yaxis_title="Oroville Reservoir Inflow (TAF)"
+    chart=lambda: card_mon_plot(
+        get_sv(),
+        b_part="OROVI",
+        wyt=[1, 2],
+        yaxis_title="Oroville Reservoir Inflow (TAF)",
     ),
     text="""Wet and Above Normal years (Sacramento Valley Index)""",
 )
@@ -1,6 +1,7 @@
 import dash_bootstrap_components as dbc
+import pandas as pd
 from dash import dash_table, dcc, html, register_page
-from utils.query_data import df_dv, scen_aliases, var_dict
+from utils.query_data import get_dv, get_scen_aliases, var_dict
 from utils.tools import make_summary_df
 
 
@@ -20,41 +21,46 @@ summary_text = (
     html.Br(),
 )
 
-exp_tbl = make_summary_df(
-    scen_aliases,
-    df_dv,
-    var_dict,
-    bparts=[
-        "C_LWSTN",
-        "D_LWSTN_CCT011",
-        "C_WKYTN",
-        "C_KSWCK",
-        "C_SAC097",
-        "C_FTR059",
-        "C_FTR003",
-        "C_YUB006",
-        "C_SAC083",
-        "C_NTOMA",
-        "C_AMR004",
-        #   '----'
-        "DELTAINFLOWFORNDOI",
-        #    '----'
-        "NDOI",
-        #
-        "C_CAA003",
-        "C_CAA003_SWP",
-        "C_CAA003_CVP",
-        "C_CAA003_WTS",
-        "C_DMC000",
-        "C_DMC000_CVP",
-        "C_DMC000_WTS",
-        #    '----',
-        "SWP_TA_TOTAL",
-        "SWP_IN_TOTAL",
-        "SWP_CO_TOTAL",
-        "CVPTOTALDEL",
-    ],
-)
+summary_bparts = [
+    "C_LWSTN",
+    "D_LWSTN_CCT011",
+    "C_WKYTN",
+    "C_KSWCK",
+    "C_SAC097",
+    "C_FTR059",
+    "C_FTR003",
+    "C_YUB006",
+    "C_SAC083",
+    "C_NTOMA",
+    "C_AMR004",
+    #   '----'
+    "DELTAINFLOWFORNDOI",
+    #    '----'
+    "NDOI",
+    #
+    "C_CAA003",
+    "C_CAA003_SWP",
+    "C_CAA003_CVP",
+    "C_CAA003_WTS",
+    "C_DMC000",
+    "C_DMC000_CVP",
+    "C_DMC000_WTS",
+    #    '----',
+    "SWP_TA_TOTAL",
+    "SWP_IN_TOTAL",
+    "SWP_CO_TOTAL",
+    "CVPTOTALDEL",
+]
+
+
+def summary_table() -> pd.DataFrame:
+    return make_summary_df(
+        get_scen_aliases(),
+        get_dv(),
+        var_dict,
+        bparts=summary_bparts,
+    )
+
 
 # Determine the table order
 # Descriptive stuff goes first
@@ -66,17 +72,15 @@ table_order = [
 
 ]
 
-# Scenarios go next
-table_order.extend(
-    [
+
+def layout():
+    exp_tbl = summary_table()
+    # Scenarios go next
+    columns = table_order + [
         {"name": s, "id": s, "type": "numeric", "format": {"specifier": ",.0f"}}
-        for s in scen_aliases
+        for s in get_scen_aliases()
         if s not in ["description", "index", "type"]
     ]
-)
-
-
-def layout():
     layout = dbc.Container(
         class_name="my-3",
         children=[
@@ -87,7 +91,7 @@ def layout():
                     dcc.Markdown("#### "),
                     dash_table.DataTable(
                         id="exp_tbl",
-                        columns=table_order,
+                        columns=columns,
                         data=exp_tbl.to_dict(orient="records"),
                         style_header={
                             "backgroundColor": "rgb(200, 200, 200)",
@@ -106,6 +110,3 @@ def layout():
         ],
     )
     return layout
-
-
-layout()
@@ -17,6 +17,11 @@ echo "cd to code"
 cd "code"|| exit
 ls
 
+# Precompute the artifacts and figures the server processes load, the server
+# still starts (and builds them on first use) if this fails
+echo "Precomputing the app state..."
+python warm_cache.py || echo "warm_cache.py failed, starting without precomputed artifacts"
+
 echo "Running the application..."
 export FLASK_DEBUG=1
 flask run -h 0.0.0.0 -p 80
@@ -1,14 +1,13 @@
 from collections import namedtuple
 
 import pandas as pd
-import yaml
 
+from utils.catalog import load_catalog
 from utils.tools import load_data_mult
 
 # Scenario management
 Scenario = namedtuple("Scenario", ["pathname", "alias", "active"])
-with open("constants/dvars.yaml", "r") as file:
-    var_dict = yaml.safe_load(file)
+var_dict = load_catalog("constants/dvars.yaml")
 
 # s1 = Scenario('dss_files/DCRBL_DV_6.68.dss', 'DCR_21_Hist',1)
 # s2 = Scenario('dss_files/DCR2023_DV_9.0.0_Danube_Adj_v1.2.dss', 'DCR_23_Adj',1)
@@ -41,4 +40,16 @@ for s in scenarios:
     if s.active == 1:
         scen_dict[s.alias] = s.pathname
 
-load_data_mult(scen_dict, var_dict, date_map)
+# Number of DSS files to read at once, None for one process per file
+processes = None
+# Only re-read DSS files (and variables) that changed since the last load
+incremental = True
+
+if __name__ == "__main__":
+    load_data_mult(
+        scen_dict,
+        var_dict,
+        date_map,
+        processes=processes,
+        incremental=incremental,
+    )
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pandss")
+
+from utils.cube import get_cube  # noqa: E402
+from utils.query_data import get_dv, var_dict  # noqa: E402
+from utils.tools import cfs_taf  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def df_dv():
+    return get_dv()
+
+
+@pytest.mark.parametrize("taf", [False, True])
+@pytest.mark.parametrize("yrkind", ["iwy", "icy"])
+def test_range_sum_matches_groupby(df_dv, yrkind, taf):
+    # The sums must be the same as the groupby sums of the long DataFrame, to
+    # the last bit, so that rounded published values don't change
+    cube = get_cube(df_dv, var_dict)
+    df = cfs_taf(df_dv, var_dict) if taf else df_dv
+    expected = df.groupby(["Scenario", yrkind])[cube.variables].sum()
+    for year, group in expected.groupby(level=yrkind):
+        result = cube.range_sum(yrkind, year, year, range(1, 13), taf=taf)
+        pd.testing.assert_frame_equal(
+            result, group.droplevel(yrkind), check_exact=True, check_names=False
+        )
+
+
+def test_range_sum_months_matches_groupby(df_dv):
+    cube = get_cube(df_dv, var_dict)
+    df = cfs_taf(df_dv, var_dict)
+    for months, start_yr, end_yr in [
+        ([10, 11, 12], 1922, 2021),
+        ([1, 5, 9], 1940, 1960),
+    ]:
+        rows = df["iwy"].between(start_yr, end_yr) & df["icm"].isin(months)
+        expected = df[rows].groupby("Scenario")[cube.variables].sum()
+        result = cube.range_sum("iwy", start_yr, end_yr, months, taf=True)
+        assert np.array_equal(result.to_numpy(), expected.to_numpy(), equal_nan=True)
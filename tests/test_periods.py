@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pandss")
+
+from utils.periods import get_period_table  # noqa: E402
+from utils.query_data import common_pers, get_dv, var_dict  # noqa: E402
+from utils.tools import cfs_taf  # noqa: E402
+
+
+@pytest.mark.parametrize("yrkind", ["iwy", "icy"])
+def test_lookup_matches_groupby(yrkind):
+    # Rounded as the summary tables are, every average must be the same as
+    # make_summary_df's groupby sum over the period
+    df_dv = get_dv()
+    table = get_period_table(df_dv, var_dict, common_pers)
+    df = cfs_taf(df_dv, var_dict)
+    for name, (start_yr, end_yr) in table.spans.items():
+        result = table.lookup(yrkind, start_yr, end_yr)
+        rows = df[yrkind].between(start_yr, end_yr)
+        expected = df[rows].groupby("Scenario")[result.columns].sum()
+        expected = round(expected / (end_yr - start_yr + 1))
+        assert result.index.equals(expected.index), name
+        assert np.array_equal(
+            round(result).to_numpy(), expected.to_numpy(), equal_nan=True
+        ), name
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.frame_cache import frame_cache, frame_cache_lock, frame_fingerprint
+from utils.memo import TableCache
+from utils.periods import PeriodTable
+
+# Set RECON_ARTIFACT_DIR to move the precomputed artifacts, or to "" to not use
+# them
+ARTIFACT_DIR = os.environ.get("RECON_ARTIFACT_DIR", "data/artifacts")
+
+# Bump when the layout of the saved tables changes, so artifacts written by an
+# older version are ignored
+ARTIFACT_VERSION = 2
+
+# Lists the tables of an artifact directory, each saved as a .npy file next to it
+INDEX_FILE = "index.json"
+
+
+def artifact_path(df: pd.DataFrame, var_dict: dict) -> Path:
+    """
+    The artifact directory of a study DataFrame. The name hashes the contents
+    of the DataFrame and the unit conversions of the catalog, so it is only
+    ever used for the data it was built from.
+    """
+    conversions = [[key, entry.get("table_convert")] for key, entry in var_dict.items()]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(frame_fingerprint(df).encode())
+    digest.update(json.dumps(conversions).encode())
+    return Path(ARTIFACT_DIR) / f"v{ARTIFACT_VERSION}" / digest.hexdigest()
+
+
+def _write_frame(table: pd.DataFrame, directory: Path, name: str) -> dict:
+    # The numeric columns are saved as one .npy array, to be memory-mapped, and
+    # the rest (labels, descriptions) with the index in the JSON index
+    numeric = [c for c in table.columns if pd.api.types.is_float_dtype(table[c])]
+    np.save(directory / f"{name}.npy", table[numeric].to_numpy(dtype="float64"))
+    index = table.index
+    return {
+        "file": f"{name}.npy",
+        "columns": table.columns.tolist(),
+        "columns_name": table.columns.name,
+        "numeric": numeric,
+        "other": [
+            [c, str(table[c].dtype), table[c].tolist()]
+            for c in table.columns
+            if c not in numeric
+        ],
+        "index": None if isinstance(index, pd.RangeIndex) else index.tolist(),
+        "index_name": index.name,
+        "length": len(index),
+    }
+
+
+def _read_frame(meta: dict, directory: Path) -> pd.DataFrame:
+    values = np.load(directory / meta["file"], mmap_mode="r")
+    if meta["index"] is None:
+        index = pd.RangeIndex(meta["length"], name=meta["index_name"])
+    else:
+        index = pd.Index(meta["index"], name=meta["index_name"])
+    table = pd.DataFrame(values, index=index, columns=meta["numeric"], copy=False)
+    for column, dtype, data in meta["other"]:
+        table[column] = pd.array(data, dtype=dtype)
+    table = table[meta["columns"]]
+    table.columns.name = meta["columns_name"]
+    return table
+
+
+def _as_key(value):
+    # JSON turns the tuples of a TableCache key into lists
+    return tuple(_as_key(v) for v in value) if isinstance(value, list) else value
+
+
+def save_artifacts(
+    df: pd.DataFrame, var_dict: dict, tables: dict[str, TableCache] | None = None
+) -> Path:
+    """
+    Save the period tables built so far for a study DataFrame, and the tables
+    cached from it, for load_artifacts in other processes. Only these are slow
+    to build: the cube, indexes and exceedance runs take less time to rebuild
+    than to read.
+
+    Args:
+    - df: Study DataFrame.
+    - var_dict: Variable catalog the tables were built with.
+    - tables: Name -> TableCache of the table functions to save, e.g.
+      {"make_summary_df": make_summary_df}.
+
+    Returns:
+    - The artifact directory.
+    """
+    path = artifact_path(df, var_dict)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    n = 0
+    index = {"tables": {}, "period_tables": []}
+    for name, table in (tables or {}).items():
+        index["tables"][name] = []
+        for key, result in table.export(df, var_dict):
+            meta = _write_frame(result, tmp, str(n))
+            index["tables"][name].append({"key": key, "frame": meta})
+            n += 1
+    with frame_cache_lock:
+        period_tables = list(frame_cache(df).get("period_tables", {}).values())
+    for period_table in period_tables:
+        saved = {"periods": period_table.periods, "tables": []}
+        for key, result in period_table.tables.items():
+            meta = _write_frame(result, tmp, str(n))
+            saved["tables"].append({"key": key, "frame": meta})
+            n += 1
+        index["period_tables"].append(saved)
+    with open(tmp / INDEX_FILE, "w") as f:
+        json.dump(index, f)
+    # Readers only ever see a complete directory, or none
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+def prune_artifacts(keep: list[Path]) -> list[Path]:
+    """
+    Delete the artifacts in ARTIFACT_DIR other than those in keep, e.g. those of
+    older data or of an older ARTIFACT_VERSION.
+
+    Returns:
+    - The deleted files and directories.
+    """
+    keep = {Path(p).resolve() for p in keep}
+    removed = []
+    for version in Path(ARTIFACT_DIR).glob("v*"):
+        for path in version.iterdir():
+            if path.resolve() not in keep:
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                removed.append(path)
+        if not any(version.iterdir()):
+            version.rmdir()
+    return removed
+
+
+def load_artifacts(
+    df: pd.DataFrame, var_dict: dict, tables: dict[str, TableCache] | None = None
+) -> bool:
+    """
+    Load the artifacts saved for a DataFrame with the same contents as df, if
+    there are any. The saved arrays are memory-mapped, so every worker process
+    shares one copy. Tables already built for df are kept.
+
+    Args:
+    - df: Study DataFrame.
+    - var_dict: Variable catalog.
+    - tables: Name -> TableCache to preload with the saved tables.
+
+    Returns:
+    - Whether artifacts were found and loaded.
+    """
+    # Nothing to hash the DataFrame for if no artifacts were ever saved
+    if not ARTIFACT_DIR or not (Path(ARTIFACT_DIR) / f"v{ARTIFACT_VERSION}").is_dir():
+        return False
+    path = artifact_path(df, var_dict)
+    try:
+        with open(path / INDEX_FILE, "r") as f:
+            index = json.load(f)
+        saved = {
+            name: [
+                (_as_key(entry["key"]), _read_frame(entry["frame"], path))
+                for entry in entries
+            ]
+            for name, entries in index["tables"].items()
+        }
+        period_tables = [
+            PeriodTable.from_tables(
+                saved_table["periods"],
+                {
+                    _as_key(entry["key"]): _read_frame(entry["frame"], path)
+                    for entry in saved_table["tables"]
+                },
+            )
+            for saved_table in index["period_tables"]
+        ]
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Unable to load the artifacts {path}: {e}")
+        return False
+
+    with frame_cache_lock:
+        cache = frame_cache(df).setdefault("period_tables", {})
+        for period_table in period_tables:
+            cache.setdefault(tuple(period_table.periods.items()), period_table)
+    for name, table in (tables or {}).items():
+        table.preload(df, var_dict, saved.get(name, []))
+    print(f"Loaded the precomputed artifacts {path}")
+    return True
@@ -0,0 +1,146 @@
+import os
+import pickle
+from pathlib import Path
+
+import yaml
+
+# Compiled catalogs are cached here, next to the data stores
+CATALOG_CACHE_DIR = "data/catalog"
+
+# Bump when the layout of Variable or Catalog changes, so old caches are rebuilt
+CATALOG_VERSION = 1
+
+
+class Variable:
+    """
+    One entry of a variable catalog (constants/dvars.yaml or svars.yaml).
+    Fields can also be read like a dict, e.g. var_dict[b]["alias"].
+    """
+
+    __slots__ = ("bpart", "alias", "pathname", "table_convert", "table_display", "type")
+
+    def __init__(
+        self,
+        bpart: str,
+        alias: str | None = None,
+        pathname: str | None = None,
+        table_convert: str | None = None,
+        table_display: str | None = None,
+        type: str | None = None,
+    ):
+        self.bpart = bpart
+        self.alias = alias
+        self.pathname = pathname
+        self.table_convert = table_convert
+        self.table_display = table_display
+        self.type = type
+
+    def __getitem__(self, field: str):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field: str, default=None):
+        return getattr(self, field) if field in self.__slots__ else default
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"Variable({self.to_dict()})"
+
+
+class Catalog(dict):
+    """
+    Variable catalog: a dict of variable name to Variable, in YAML order, with
+    indexes that are kept up to date as variables are added.
+
+    - by_type: type -> variable names
+    - by_convert: table_convert -> variable names
+    - alias_to_bpart: alias -> the first variable with that alias
+    - position: variable name -> position in the catalog
+    """
+
+    def __init__(self, entries: dict | None = None):
+        super().__init__()
+        self.by_type: dict[str, list[str]] = {}
+        self.by_convert: dict[str | None, list[str]] = {}
+        self.alias_to_bpart: dict[str, str] = {}
+        self.position: dict[str, int] = {}
+        self._fields: dict[str, dict] = {}
+        for key, entry in (entries or {}).items():
+            self[key] = entry
+
+    def __setitem__(self, key: str, entry: dict | Variable) -> None:
+        if not isinstance(entry, Variable):
+            entry = Variable(**{"bpart": key} | dict(entry))
+        if key in self:
+            self._unindex(key)
+        else:
+            self.position[key] = len(self.position)
+        super().__setitem__(key, entry)
+        self._fields.clear()
+        self.by_type.setdefault(entry.type, []).append(key)
+        self.by_convert.setdefault(entry.table_convert, []).append(key)
+        self.alias_to_bpart.setdefault(entry.alias, key)
+
+    def _unindex(self, key: str) -> None:
+        entry = self[key]
+        self.by_type[entry.type].remove(key)
+        self.by_convert[entry.table_convert].remove(key)
+        if self.alias_to_bpart.get(entry.alias) == key:
+            del self.alias_to_bpart[entry.alias]
+
+    def field(self, name: str) -> dict:
+        """Variable name -> one field of every variable, e.g. field("alias")."""
+        if name not in self._fields:
+            self._fields[name] = {key: entry[name] for key, entry in self.items()}
+        return self._fields[name]
+
+    def __reduce__(self):
+        # Rebuild through __init__, so the indexes are restored with the entries
+        return (self.__class__, (dict(self),))
+
+
+def as_catalog(var_dict: dict) -> Catalog:
+    """The var_dict itself if it is a Catalog, otherwise a Catalog built from it."""
+    return var_dict if isinstance(var_dict, Catalog) else Catalog(var_dict)
+
+
+def load_catalog(
+    path: str | Path, cache_dir: str | Path = CATALOG_CACHE_DIR
+) -> Catalog:
+    """
+    Read a variable catalog YAML file into a Catalog. The compiled catalog is
+    pickled in cache_dir and reused until the size or mtime of the YAML changes.
+
+    Args:
+    - path: The YAML file, e.g. "constants/dvars.yaml".
+    - cache_dir: Directory for the compiled catalog.
+
+    Returns:
+    - The Catalog.
+    """
+    path = Path(path)
+    stat = path.stat()
+    stamp = (CATALOG_VERSION, stat.st_size, stat.st_mtime_ns)
+    cache = Path(cache_dir) / f"{path.stem}.pkl"
+    try:
+        with open(cache, "rb") as f:
+            cached_stamp, catalog = pickle.load(f)
+        if cached_stamp == stamp:
+            return catalog
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+
+    with open(path, "r") as file:
+        catalog = Catalog(yaml.safe_load(file))
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((stamp, catalog), f)
+        os.replace(tmp, cache)
+    except OSError as e:
+        print(f"Unable to cache the compiled catalog {cache}: {e}")
+    return catalog
@@ -0,0 +1,381 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from utils.frame_cache import frame_cache, frame_cache_lock
+
+# Calendar and water year/month columns merged in from constants/date_map.csv,
+# plus the CFS to TAF factor for each month. They become the time axes of the cube.
+TIME_COLUMNS = ["icy", "icm", "iwy", "iwm", "cfs_taf"]
+
+# Number of (variable, month selection) sorts kept by each cube
+SORTED_MONTHS_CACHE_SIZE = 256
+
+
+def compensated_sum(terms: Iterable[np.ndarray], shape: tuple) -> np.ndarray:
+    """
+    Sum of a sequence of arrays, skipping NaNs, with the compensated (Kahan)
+    summation of pandas' groupby sum and mean. Added in the order of the rows
+    of the DataFrame, the totals are the same as the groupby's to the last bit,
+    so tables rounded for display don't change.
+    """
+    total = np.zeros(shape)
+    compensation = np.zeros(shape)
+    for x in terms:
+        valid = ~np.isnan(x)
+        y = x - compensation
+        t = total + y
+        c = (t - total) - y
+        c[np.isnan(c)] = 0  # As pandas does, after adding an infinite value
+        compensation = np.where(valid, c, compensation)
+        total = np.where(valid, t, total)
+    return total
+
+
+class DataCube:
+    """
+    Dense scenario x water year x water month x variable array of a study
+    DataFrame (df_dv or df_sv), so that queries are slices and reductions along
+    axes instead of boolean masks and groupbys on the long DataFrame.
+
+    - values: the data, NaN where a scenario has no row for a month, in the
+      dtype of the DataFrame (float32 with RECON_COMPACT_SCHEMA=1)
+    - present: scenario x water year x water month, True where the row exists
+    - icy, icm, cfs_taf: water year x water month arrays of the calendar year,
+      calendar month and CFS to TAF factor of each cell
+    - scenarios, water_years, variables: the labels of the axes, with
+      scenario_index and var_index mapping labels to positions
+    """
+
+    def __init__(self, df: pd.DataFrame, var_dict: dict):
+        codes, scenarios = pd.factorize(df["Scenario"], sort=True)
+        iwy = df["iwy"].to_numpy().astype(int)
+        iwm = df["iwm"].to_numpy().astype(int)
+        self.first_wy = iwy.min()
+        self.water_years = np.arange(self.first_wy, iwy.max() + 1)
+        self.scenarios = list(scenarios)
+        self.variables = [c for c in df.columns if c not in ["Scenario", *TIME_COLUMNS]]
+        self.scenario_index = {s: i for i, s in enumerate(self.scenarios)}
+        self.var_index = {v: i for i, v in enumerate(self.variables)}
+
+        cell = (codes, iwy - self.first_wy, iwm - 1)
+        shape = (len(self.scenarios), len(self.water_years), 12)
+        self.present = np.zeros(shape, dtype=bool)
+        self.present[cell] = True
+        if self.present.sum() != len(df):
+            raise ValueError("the data has more than one row per scenario and month")
+
+        # Filled a column at a time, without a second copy of the whole DataFrame
+        dtype = np.result_type(*df[self.variables].dtypes)
+        self.values = np.full((*shape, len(self.variables)), np.nan, dtype)
+        for i, v in enumerate(self.variables):
+            self.values[(*cell, i)] = df[v].to_numpy()
+
+        # The time columns are the same for every scenario
+        for col in ["icy", "icm", "cfs_taf"]:
+            arr = np.full(shape[1:], np.nan)
+            arr[cell[1:]] = df[col].to_numpy()
+            setattr(self, col, arr)
+
+        self.convert = np.array(
+            [
+                var_dict.get(v, {}).get("table_convert") == "cfs_taf"
+                for v in self.variables
+            ]
+        )
+        self._year_cells = {}
+        self._month_runs = {}
+        self._sorted_months = OrderedDict()
+        self._lock = threading.Lock()
+
+    def var(self, b_part: str, taf: bool = False) -> np.ndarray:
+        """
+        Scenario x water year x water month array of one variable, converted
+        from CFS to TAF as in cfs_taf if taf. Only this variable is converted.
+        """
+        i = self.var_index[b_part]
+        if taf and self.convert[i]:
+            return self.values[..., i] * self.cfs_taf
+        return self.values[..., i]
+
+    def year(self, yrkind: str) -> np.ndarray:
+        """Water year x water month array of the water or calendar year of each cell."""
+        if yrkind == "icy":
+            return self.icy
+        return np.broadcast_to(self.water_years[:, np.newaxis], self.icy.shape)
+
+    def cells(
+        self,
+        yrkind: str = "iwy",
+        start_yr: int | None = None,
+        end_yr: int | None = None,
+        months: Iterable[int] | None = None,
+    ) -> np.ndarray:
+        """
+        Water year x water month mask of the cells in a year range and set of
+        calendar months.
+        """
+        mask = np.ones(self.icy.shape, dtype=bool)
+        if start_yr is not None or end_yr is not None:
+            year = self.year(yrkind)
+            if start_yr is not None:
+                mask &= year >= start_yr
+            if end_yr is not None:
+                mask &= year <= end_yr
+        if months is not None:
+            mask &= np.isin(self.icm, list(months))
+        return mask
+
+    def wyt_mask(self, wyt: Iterable[int]) -> np.ndarray:
+        """Scenario x water year x water month mask of the water year types in wyt."""
+        return np.isin(self.var("WYT_SAC_"), list(wyt))
+
+    def _totals(
+        self,
+        cells: np.ndarray,
+        variables: list[str] | None,
+        taf: bool,
+        selected: np.ndarray | None = None,
+    ) -> np.ndarray:
+        # Scenario x variable totals over the cells (flat water year x water
+        # month positions), added in that order with compensated_sum. The TAF
+        # values are converted cell by cell, as cfs_taf does row by row.
+        v = slice(None) if variables is None else [self.var_index[x] for x in variables]
+        flat = self.values.reshape(len(self.scenarios), -1, len(self.variables))
+        factors = self.cfs_taf.ravel()
+        convert = self.convert[v]
+
+        def terms():
+            for c in cells:
+                x = flat[:, c, v]
+                if taf:
+                    x = x * np.where(convert, factors[c], 1.0)
+                if selected is not None:
+                    x = np.where(selected[:, c, np.newaxis], x, np.nan)
+                yield x
+
+        n_vars = len(self.variables) if variables is None else len(variables)
+        return compensated_sum(terms(), (len(self.scenarios), n_vars))
+
+    def _frame(
+        self, totals: np.ndarray, rows: np.ndarray, variables: list[str] | None
+    ) -> pd.DataFrame:
+        return pd.DataFrame(
+            totals[rows],
+            index=pd.Index(np.array(self.scenarios)[rows], name="Scenario"),
+            columns=self.variables if variables is None else variables,
+        )
+
+    def sum(
+        self,
+        cells: np.ndarray,
+        taf: bool = False,
+        variables: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """
+        Totals of every variable over the selected cells, same as a groupby sum
+        on Scenario. Only scenarios with at least one selected row are returned.
+
+        Args:
+        - cells: water year x water month mask, or scenario x water year x water
+          month mask when the selection differs by scenario (e.g. by WYT).
+        - taf: sum the TAF values instead of the original units.
+        - variables: only compute these columns, in that order.
+
+        Returns:
+        - DataFrame of scenarios by variables.
+        """
+        present = self.present.reshape(len(self.scenarios), -1)
+        if cells.ndim == 2:
+            order = np.flatnonzero(cells)
+            selected = None
+            rows = present[:, order].any(axis=1)
+        else:
+            selected = (cells & self.present).reshape(len(self.scenarios), -1)
+            order = np.flatnonzero(selected.any(axis=0))
+            rows = selected.any(axis=1)
+        totals = self._totals(order, variables, taf, selected)
+        return self._frame(totals, rows, variables)
+
+    def year_cells(self, yrkind: str) -> tuple[int, np.ndarray]:
+        """
+        The cells of each year (water years for "iwy", calendar years for
+        "icy") in date order, built on first use.
+
+        Returns:
+        - first_yr: the first year
+        - index: years x 12 array of flat water year x water month positions,
+          -1 where there is no cell
+        """
+        with self._lock:
+            cached = self._year_cells.get(yrkind)
+        if cached is None:
+            year = self.year(yrkind)
+            valid = ~np.isnan(year) & ~np.isnan(self.icm)
+            first_yr = int(year[valid].min())
+            n_years = int(year[valid].max()) - first_yr + 1
+            # Water years run from water month 1, calendar years from January
+            slot = (
+                self.icm[valid] - 1
+                if yrkind == "icy"
+                else np.nonzero(valid)[1]
+            ).astype(int)
+            index = np.full((n_years, 12), -1)
+            index[(year[valid] - first_yr).astype(int), slot] = np.flatnonzero(valid)
+            with self._lock:
+                cached = self._year_cells.setdefault(yrkind, (first_yr, index))
+        return cached
+
+    def range_sum(
+        self,
+        yrkind: str,
+        start_yr: int,
+        end_yr: int,
+        months: Iterable[int],
+        taf: bool = False,
+        variables: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """
+        Same as sum(cells(yrkind, start_yr, end_yr, months), taf), with the
+        cells of the years in the range looked up instead of masked.
+        With variables, only those columns are computed, in that order.
+        """
+        first_yr, index = self.year_cells(yrkind)
+        n_years = len(index)
+        lo = min(max(int(start_yr) - first_yr, 0), n_years)
+        hi = max(min(int(end_yr) - first_yr + 1, n_years), lo)
+        cells = index[lo:hi].ravel()
+        cells = cells[cells >= 0]
+        cells = cells[np.isin(self.icm.ravel()[cells], list(months))]
+        present = self.present.reshape(len(self.scenarios), -1)
+        rows = present[:, cells].any(axis=1)
+        return self._frame(self._totals(cells, variables, taf), rows, variables)
+
+    def annual_totals(
+        self,
+        b_part: str,
+        yrkind: str,
+        months: Iterable[int],
+        taf: bool = False,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Yearly totals of one variable over a set of calendar months, same as a
+        groupby sum on Scenario and year.
+
+        Returns:
+        - years: the years of the table
+        - totals: scenario x year array, NaN for years without rows
+        """
+        first_yr, index = self.year_cells(yrkind)
+        cells = np.where(index >= 0, index, 0)
+        keep = (index >= 0) & np.isin(self.icm.ravel()[cells], list(months))
+        n = len(self.scenarios)
+        values = self.var(b_part, taf).reshape(n, -1)[:, cells]
+        values = np.where(keep, values, np.nan)
+        present = self.present.reshape(n, -1)[:, cells] & keep
+        # Added month by month in date order, for every scenario and year at once
+        totals = compensated_sum(values.transpose(2, 0, 1), values.shape[:2])
+        rows = present.any(axis=2)
+        years = np.arange(first_yr, first_yr + len(index))
+        return years, np.where(rows, totals, np.nan)
+
+    def month_runs(self, b_part: str) -> np.ndarray:
+        """
+        Scenario x calendar month x year array of one variable, with the values
+        of each scenario and calendar month sorted (NaNs last). Built on first use.
+        """
+        with self._lock:
+            runs = self._month_runs.get(b_part)
+        if runs is None:
+            # Water month column of each calendar month
+            columns = np.argsort(np.nanmax(self.icm, axis=0))
+            runs = np.sort(self.var(b_part)[:, :, columns].transpose(0, 2, 1), axis=2)
+            runs.flags.writeable = False
+            with self._lock:
+                runs = self._month_runs.setdefault(b_part, runs)
+        return runs
+
+    def sorted_months(self, b_part: str, months: Iterable[int]) -> np.ndarray:
+        """
+        Sorted values (NaNs last) of one variable in a set of calendar months,
+        one row per scenario. The presorted runs of the months are merged rather
+        than sorted again, and the result is cached per variable and months.
+        """
+        key = (b_part, tuple(np.unique([m for m in months if 1 <= m <= 12])))
+        with self._lock:
+            if key in self._sorted_months:
+                self._sorted_months.move_to_end(key)
+                return self._sorted_months[key]
+        runs = self.month_runs(b_part)[:, [m - 1 for m in key[1]]]
+        merged = runs.reshape(len(self.scenarios), -1)
+        if len(key[1]) > 1:
+            # The stable sort (timsort/radix) finds the sorted runs and merges them
+            merged = np.sort(merged, axis=1, kind="stable")
+        merged.flags.writeable = False
+        with self._lock:
+            self._sorted_months[key] = merged
+            self._sorted_months.move_to_end(key)
+            while len(self._sorted_months) > SORTED_MONTHS_CACHE_SIZE:
+                self._sorted_months.popitem(last=False)
+        return merged
+
+    def wyt_monthly_means(
+        self,
+        b_part: str,
+        wyt: Iterable[int],
+        start_yr: int | None = None,
+        end_yr: int | None = None,
+    ) -> pd.DataFrame:
+        """
+        Mean of one variable per scenario and water month, over the water years
+        in [start_yr, end_yr] whose type is in wyt. Same as filtering on
+        WYT_SAC_ and iwy and taking a groupby mean on Scenario and iwm.
+
+        Returns:
+        - DataFrame indexed by Scenario and iwm, with a b_part column
+        """
+        n_years = len(self.water_years)
+        lo = 0 if start_yr is None else min(max(start_yr - self.first_wy, 0), n_years)
+        hi = n_years if end_yr is None else end_yr - self.first_wy + 1
+        hi = max(min(hi, n_years), lo)
+        selected = (self.wyt_mask(wyt) & self.present)[:, lo:hi]
+        values = np.where(selected, self.var(b_part)[:, lo:hi], np.nan)
+        # Added year by year, for every scenario and water month at once
+        total = compensated_sum(values.transpose(1, 0, 2), selected.shape[::2])
+        count = (~np.isnan(values)).sum(axis=1)
+        groups = selected.any(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(count > 0, total / count, np.nan)
+        s, m = np.nonzero(groups)
+        return pd.DataFrame(
+            {b_part: means[groups]},
+            index=pd.MultiIndex.from_arrays(
+                [np.array(self.scenarios)[s], m + 1], names=["Scenario", "iwm"]
+            ),
+        )
+
+    def scenario_rows(self, scenarios: Iterable[str], arr: np.ndarray) -> np.ndarray:
+        """
+        The rows of a scenario-first array for a list of scenarios, NaN for the
+        scenarios that aren't in the cube.
+        """
+        out = np.full((len(scenarios), *arr.shape[1:]), np.nan)
+        for i, s in enumerate(scenarios):
+            if s in self.scenario_index:
+                out[i] = arr[self.scenario_index[s]]
+        return out
+
+
+def get_cube(df: pd.DataFrame, var_dict: dict) -> DataCube:
+    """
+    The DataCube of a study DataFrame, built on first use. var_dict sets which
+    variables are converted to TAF.
+    """
+    with frame_cache_lock:
+        cache = frame_cache(df)
+        if "cube" not in cache:
+            cache["cube"] = DataCube(df, var_dict)
+        return cache["cube"]
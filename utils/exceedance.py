@@ -0,0 +1,41 @@
+import numpy as np
+
+# Non-exceedance probabilities (%) the curves are evaluated at
+PROBABILITY_GRID = np.arange(1, 101)
+
+
+def exceedance_curves(
+    values: np.ndarray, probs: np.ndarray | None = None, presorted: bool = False
+) -> np.ndarray:
+    """
+    Non-exceedance curves of several series at once.
+
+    Each row of values is sorted, the i-th smallest of n values is given the
+    probability (i + 1) / n * 100, and the curve is linearly interpolated at
+    probs, the same as np.interp row by row (held flat outside the data).
+
+    Args:
+    - values: 2-D array with one series per row, NaN for missing values.
+    - probs: probabilities (%) to evaluate the curves at, PROBABILITY_GRID by
+      default.
+    - presorted: the rows are already sorted with NaNs last.
+
+    Returns:
+    - Array of rows by probs, all NaN for rows without data.
+    """
+    probs = PROBABILITY_GRID if probs is None else np.asarray(probs)
+    values = np.atleast_2d(values)
+    if not presorted:
+        values = np.sort(values, axis=1)  # NaNs sort last
+    if values.shape[1] == 0:
+        return np.full((len(values), len(probs)), np.nan)
+    n = (~np.isnan(values)).sum(axis=1, keepdims=True)
+    # Fractional position of each probability in the sorted rows
+    pos = np.clip(probs * n / 100 - 1, 0, np.maximum(n - 1, 0))
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+    y_lo = np.take_along_axis(values, lo, axis=1)
+    y_hi = np.take_along_axis(values, hi, axis=1)
+    curves = y_lo + (pos - lo) * (y_hi - y_lo)
+    curves[n[:, 0] == 0] = np.nan
+    return curves
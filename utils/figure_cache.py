@@ -0,0 +1,237 @@
+import base64
+import functools
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import plotly
+from plotly.graph_objects import Figure
+
+from utils.frame_cache import frame_fingerprint
+from utils.profiling import REPO_ROOT, profiler
+
+# Set RECON_FIGURE_CACHE_DIR to move the figure cache, or to "" to turn it off
+FIGURE_CACHE_DIR = os.environ.get("RECON_FIGURE_CACHE_DIR", "data/figures")
+
+# Code and catalogs the figures are built with, relative to the repository: the
+# chart helpers, the data structures they read, the plot styles and the variable
+# catalogs. Editing any of them invalidates every cached figure.
+FIGURE_SOURCES = ["charts", "utils", "constants", "pages/styles.py"]
+FIGURE_SOURCE_SUFFIXES = [".py", ".yaml"]
+
+# Bump when a change not covered by FIGURE_SOURCES changes the figures, so the
+# old entries are no longer used
+FIGURE_CACHE_VERSION = 2
+
+
+def _encode(value):
+    if isinstance(
+        value, np.ndarray | pd.Index | pd.Series | pd.api.extensions.ExtensionArray
+    ):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, set | frozenset):
+        return sorted(value)
+    raise TypeError(f"can't key a figure on {type(value).__name__}")
+
+
+@functools.cache
+def source_fingerprint() -> str:
+    """
+    Hash of the FIGURE_SOURCES files and of the plotly version, computed once
+    per process.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(plotly.__version__.encode())
+    for source in FIGURE_SOURCES:
+        path = REPO_ROOT / source
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for file in files:
+            if file.suffix in FIGURE_SOURCE_SUFFIXES and file.is_file():
+                digest.update(str(file.relative_to(REPO_ROOT)).encode())
+                digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
+def _decode(obj: dict):
+    # plotly writes numeric arrays as base64 typed arrays, turn them back into
+    # numpy arrays so figures read from the cache have the same data as new ones
+    if "bdata" in obj and "dtype" in obj and set(obj) <= {"bdata", "dtype", "shape"}:
+        arr = np.frombuffer(base64.b64decode(obj["bdata"]), dtype=obj["dtype"])
+        if "shape" in obj:
+            shape = obj["shape"]
+            shape = shape.split(",") if isinstance(shape, str) else shape
+            arr = arr.reshape([int(n) for n in shape])
+        return arr
+    return obj
+
+
+class FigureCache:
+    """
+    On-disk cache of a function that builds a plotly Figure from a study
+    DataFrame, shared by every worker process.
+
+    Entries are content-addressed: the file name is a hash of the function, its
+    arguments, a fingerprint of the DataFrame contents, the FIGURE_SOURCES and
+    the values returned by context (state the function reads besides its
+    arguments, e.g. the scenario aliases), so a new dataset, new arguments or
+    new code simply map to new files. Figures are stored as plotly JSON
+    and written to a temporary file that is renamed into place, so readers in
+    other processes never see a partial entry.
+    """
+
+    def __init__(
+        self,
+        func: Callable[..., Figure],
+        directory: str | Path | None = None,
+        context: Callable[[], object] | None = None,
+    ):
+        self.func = func
+        self.directory = directory
+        self.context = context
+        self.signature = inspect.signature(func)
+        self.hits = 0
+        self.misses = 0
+        # Entries read or written by this process, see used_figures
+        self.used: set[Path] = set()
+        # The source is part of the key, so editing the function invalidates it
+        try:
+            code = inspect.getsource(func).encode()
+        except (OSError, TypeError):
+            code = func.__code__.co_code
+        self._code = hashlib.blake2b(code, digest_size=8).hexdigest()
+        functools.update_wrapper(self, func)
+
+    def key(self, *args, **kwargs) -> str | None:
+        """The cache key of a call, None if an argument can't be keyed."""
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {
+            name: (
+                {"DataFrame": frame_fingerprint(value)}
+                if isinstance(value, pd.DataFrame)
+                else value
+            )
+            for name, value in bound.arguments.items()
+        }
+        try:
+            text = json.dumps(
+                [
+                    FIGURE_CACHE_VERSION,
+                    self.func.__module__,
+                    self.func.__qualname__,
+                    self._code,
+                    source_fingerprint(),
+                    self.context() if self.context is not None else None,
+                    arguments,
+                ],
+                default=_encode,
+            )
+        except TypeError:
+            return None
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return Path(self._directory()) / f"{self.func.__name__}-{key}.json"
+
+    def _directory(self) -> str | Path:
+        # Read on each call, so FIGURE_CACHE_DIR can be changed after import
+        return FIGURE_CACHE_DIR if self.directory is None else self.directory
+
+    def __call__(self, *args, **kwargs) -> Figure:
+        if not profiler.enabled:
+            return self._call(*args, **kwargs)
+        with profiler.stage("figure", self._describe(args, kwargs)):
+            return self._call(*args, **kwargs)
+
+    def _describe(self, args: tuple, kwargs: dict) -> str:
+        # Short name of a call for the startup profile, without the DataFrames
+        shown = [a for a in args if not isinstance(a, pd.DataFrame)] + [
+            f"{k}={v}" for k, v in kwargs.items() if not isinstance(v, pd.DataFrame)
+        ]
+        text = ", ".join(str(a) for a in shown)
+        return f"{self.func.__name__}({text[:60]})"
+
+    def _call(self, *args, **kwargs) -> Figure:
+        key = self.key(*args, **kwargs) if self._directory() else None
+        if key is None:
+            return self.func(*args, **kwargs)
+
+        path = self.path(key)
+        try:
+            with open(path, "r") as f:
+                # The figure was validated when it was built, skip doing it again
+                fig = Figure(json.load(f, object_hook=_decode), _validate=False)
+            self.hits += 1
+            self.used.add(path)
+            return fig
+        except (OSError, ValueError):
+            pass
+
+        self.misses += 1
+        fig = self.func(*args, **kwargs)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                f.write(fig.to_json())
+            os.replace(tmp, path)
+            self.used.add(path)
+        except OSError as e:
+            print(f"Unable to cache the figure {path}: {e}")
+        return fig
+
+    def cache_info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def figure_cache(
+    directory: str | Path | None = None,
+    context: Callable[[], object] | None = None,
+) -> Callable[[Callable[..., Figure]], FigureCache]:
+    """
+    Decorator form of FigureCache. The cache is in FIGURE_CACHE_DIR unless a
+    directory is given.
+    """
+
+    def decorator(func: Callable[..., Figure]) -> FigureCache:
+        cache = FigureCache(func, directory=directory, context=context)
+        _figure_caches.append(cache)
+        return cache
+
+    return decorator
+
+
+# Every cache made with the figure_cache decorator, for used_figures
+_figure_caches: list[FigureCache] = []
+
+
+def used_figures() -> list[Path]:
+    """The cache files read or written by this process."""
+    return [path for cache in _figure_caches for path in cache.used]
+
+
+def prune_figures(keep: list[Path]) -> list[Path]:
+    """
+    Delete the files in FIGURE_CACHE_DIR other than those in keep, e.g. the
+    figures of older data or code, which are never read again. Figures of the
+    current data that aren't kept are rebuilt on first use.
+
+    Returns:
+    - The deleted files.
+    """
+    if not FIGURE_CACHE_DIR or not Path(FIGURE_CACHE_DIR).is_dir():
+        return []
+    keep = {Path(p).resolve() for p in keep}
+    removed = []
+    for path in Path(FIGURE_CACHE_DIR).iterdir():
+        if path.is_file() and path.resolve() not in keep:
+            path.unlink()
+            removed.append(path)
+    return removed
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import threading
+import weakref
+
+import pandas as pd
+
+# Structures derived from a study DataFrame (cube, indexes, TAF columns), kept
+# per DataFrame and dropped when it is garbage collected
+_caches: dict[int, dict] = {}
+
+# Held while an entry is looked up and built, so that threads (e.g. the warm-up
+# thread and the requests) build each entry once and never lose one. Reentrant,
+# as building an entry can need others, e.g. the period tables need the cube.
+frame_cache_lock = threading.RLock()
+
+
+def frame_cache(df: pd.DataFrame) -> dict:
+    """
+    The cache dict of a DataFrame, created on first use. Hold frame_cache_lock
+    to look up and add its entries.
+    """
+    key = id(df)
+    with frame_cache_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = {}
+            weakref.finalize(df, _caches.pop, key, None)
+        return cache
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Hash of the contents of a DataFrame (index, columns and values), computed
+    once per DataFrame.
+    """
+    with frame_cache_lock:
+        cache = frame_cache(df)
+        if "fingerprint" not in cache:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(json.dumps([str(c) for c in df.columns]).encode())
+            values = pd.util.hash_pandas_object(df, index=True).to_numpy()
+            digest.update(values.tobytes())
+            cache["fingerprint"] = digest.hexdigest()
+        return cache["fingerprint"]
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Records what has been ingested, so that unchanged DSS files aren't re-read and
+# unchanged upload folders aren't re-scanned.
+MANIFEST_PATH = "data/manifest.json"
+
+
+def _hash_file(path: str | Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_stat(pathname: str) -> dict:
+    """Size and mtime of a file, without reading it."""
+    stat = os.stat(pathname)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def same_stat(entry: dict, stat: dict) -> bool:
+    """Whether a manifest entry has the size and mtime of a file."""
+    return entry.get("size") == stat["size"] and entry.get("mtime") == stat["mtime"]
+
+
+class Manifest:
+    """
+    JSON manifest of source DSS files, the data stores built from them, and
+    scanned directories.
+
+    - files: pathname -> size, mtime, sha256 and the cached catalog of the file
+    - stores: store stem -> scenario alias -> the pathname, sha256 and variables
+      that were loaded into the store
+    - directories: directory -> mtime, and the files and folders inside it
+    """
+
+    def __init__(self, path: str | Path = MANIFEST_PATH, data: dict | None = None):
+        self.path = Path(path)
+        data = data or {}
+        self.files: dict[str, dict] = data.get("files", {})
+        self.stores: dict[str, dict] = data.get("stores", {})
+        self.directories: dict[str, dict] = data.get("directories", {})
+        # Whether anything was recorded since the manifest was loaded
+        self.changed = False
+
+    @classmethod
+    def load(cls, path: str | Path = MANIFEST_PATH) -> "Manifest":
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = None
+        return cls(path, data)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "files": self.files,
+            "stores": self.stores,
+            "directories": self.directories,
+        }
+        # Write to a temporary file first, so readers never see a partial file
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+        self.changed = False
+
+    def fingerprint(self, pathname: str) -> dict:
+        """
+        Size, mtime and content hash of a file. The hash is only recomputed when
+        the size or mtime differ from the manifest.
+        """
+        stat = file_stat(pathname)
+        entry = self.files.get(pathname, {})
+        unchanged = same_stat(entry, stat)
+        if unchanged and "sha256" in entry:
+            return entry
+        sha256 = _hash_file(pathname)
+        if not unchanged and entry.get("sha256") != sha256:
+            entry = {}  # The content changed, so the cached catalog is stale
+        entry = entry | stat | {"sha256": sha256}
+        self.files[pathname] = entry
+        self.changed = True
+        return entry
+
+    def catalog(self, pathname: str) -> list[str] | None:
+        """The cached catalog of a file, None if the file changed since."""
+        entry = self.files.get(pathname, {})
+        if not same_stat(entry, file_stat(pathname)):
+            return None
+        return entry.get("catalog")
+
+    def set_catalog(self, pathname: str, catalog: list[str]) -> None:
+        stat = file_stat(pathname)
+        entry = self.files.get(pathname, {})
+        if not same_stat(entry, stat):
+            entry = {}  # The hash, if any, is of an older version of the file
+        self.files[pathname] = entry | stat | {"catalog": catalog}
+        self.changed = True
+
+    def scan(self, directory: str, suffix: str) -> dict[str, str]:
+        """
+        List the files ending with suffix in a directory and its sub-directories.
+        Only directories whose mtime changed since the last scan are listed again.
+
+        Returns:
+        - dict of file names to file paths, empty if the directory doesn't exist
+        """
+        file_paths = {}
+        if not os.path.isdir(directory):
+            return file_paths
+        pending = [directory]
+        while pending:
+            d = pending.pop(0)
+            mtime = os.stat(d).st_mtime_ns
+            entry = self.directories.get(d)
+            if entry is None or entry["mtime"] != mtime:
+                files, dirs = [], []
+                with os.scandir(d) as it:
+                    for e in it:
+                        (dirs if e.is_dir() else files).append(e.name)
+                entry = {"mtime": mtime, "files": files, "dirs": dirs}
+                self.directories[d] = entry
+                self.changed = True
+            for filename in entry["files"]:
+                if filename.endswith(suffix):
+                    file_paths[filename] = os.path.join(d, filename)
+            # Depth first, like os.walk
+            pending[:0] = [os.path.join(d, sub) for sub in entry["dirs"]]
+        return file_paths
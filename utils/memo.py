@@ -0,0 +1,155 @@
+import functools
+import inspect
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+import pandas as pd
+
+
+class TableCache:
+    """
+    Size-bounded LRU cache of a function that builds a table from a study
+    DataFrame and filter arguments, e.g. make_summary_df.
+
+    The key is the normalized call: defaults are filled in, DataFrames and dicts
+    are keyed by identity, the arguments named in unordered become sorted
+    tuples and other lists and arrays become tuples. Each call returns a copy of
+    the cached table, so callers can't change what later callers get.
+    """
+
+    def __init__(
+        self,
+        func: Callable[..., pd.DataFrame],
+        maxsize: int = 128,
+        unordered: Iterable[str] = (),
+    ):
+        self.func = func
+        self.maxsize = maxsize
+        self.unordered = set(unordered)
+        self.signature = inspect.signature(func)
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        functools.update_wrapper(self, func)
+
+    def _normalize(self, name: str, value, refs: list) -> object:
+        if isinstance(value, pd.DataFrame):
+            refs.append(weakref.ref(value))
+            return ("DataFrame", id(value))
+        if isinstance(value, dict):
+            return ("dict", id(value))
+        if name in self.unordered and value is not None:
+            return tuple(sorted(set(value)))
+        if pd.api.types.is_list_like(value) and hasattr(value, "__len__"):
+            return tuple(value)
+        return value
+
+    def __call__(self, *args, **kwargs) -> pd.DataFrame:
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        refs = []
+        key = tuple(
+            (name, self._normalize(name, value, refs))
+            for name, value in bound.arguments.items()
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return self.func(*args, **kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            # The DataFrames must still be alive, or their ids may have been reused
+            if entry is not None and all(ref() is not None for ref in entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].copy()
+            self.misses += 1
+
+        result = self.func(*args, **kwargs)
+        with self._lock:
+            self._entries[key] = (refs, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return result.copy()
+
+    def export(self, df: pd.DataFrame, var_dict: dict) -> list[tuple]:
+        """
+        The cached tables computed from df and var_dict (and no other DataFrame or
+        dict), with both replaced by placeholders in the keys, so they can be
+        saved and preloaded in another process with preload.
+        """
+        tokens = {
+            ("DataFrame", id(df)): ("DataFrame", None),
+            ("dict", id(var_dict)): ("dict", None),
+        }
+        with self._lock:
+            items = list(self._entries.items())
+        entries = []
+        for key, (refs, result) in items:
+            if not any(ref() is df for ref in refs):
+                continue
+            values = [value for _, value in key]
+            if any(
+                isinstance(v, tuple)
+                and v[:1] in [("DataFrame",), ("dict",)]
+                and v not in tokens
+                for v in values
+            ):
+                continue
+            key = tuple((name, tokens.get(value, value)) for name, value in key)
+            entries.append((key, result))
+        return entries
+
+    def preload(self, df: pd.DataFrame, var_dict: dict, entries: list[tuple]) -> int:
+        """
+        Add tables exported from a DataFrame with the same contents as df.
+
+        Returns:
+        - The number of tables added.
+        """
+        tokens = {
+            ("DataFrame", None): ("DataFrame", id(df)),
+            ("dict", None): ("dict", id(var_dict)),
+        }
+        added = 0
+        with self._lock:
+            for key, result in entries:
+                key = tuple((name, tokens.get(value, value)) for name, value in key)
+                if key not in self._entries:
+                    self._entries[key] = ([weakref.ref(df)], result)
+                    added += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return added
+
+    def cache_info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "maxsize": self.maxsize,
+                "currsize": len(self._entries),
+            }
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def table_cache(
+    maxsize: int = 128, unordered: Iterable[str] = ()
+) -> Callable[[Callable[..., pd.DataFrame]], TableCache]:
+    """
+    Decorator form of TableCache.
+    """
+
+    def decorator(func: Callable[..., pd.DataFrame]) -> TableCache:
+        return TableCache(func, maxsize=maxsize, unordered=unordered)
+
+    return decorator
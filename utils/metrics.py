@@ -0,0 +1,206 @@
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Callable
+
+import numpy as np
+from dash.exceptions import PreventUpdate
+from flask import Flask, Response
+
+# Set RECON_METRICS=1 to time the callbacks and serve /metrics and /ready. They
+# are served on the port of the app, so only turn them on where that port isn't
+# public, e.g. behind a proxy that doesn't forward those paths.
+METRICS_ENABLED = os.environ.get("RECON_METRICS", "0") == "1"
+
+# Upper bounds of the histogram buckets of callback latency (s) and response
+# size (bytes)
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+PAYLOAD_BUCKETS = [1e3, 1e4, 1e5, 1e6, 1e7]
+
+# The quantiles of each callback are computed over its most recent calls
+RECENT_CALLS = 1024
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram, as in the Prometheus text format.
+    """
+
+    def __init__(self, buckets: list[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines = []
+        total = 0
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class CallbackStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.payload = Histogram(PAYLOAD_BUCKETS)
+        self.errors = 0
+        self.recent = deque(maxlen=RECENT_CALLS)
+
+
+class CallbackMetrics:
+    """
+    Latency, response size and error counts of the Dash callbacks, by callback
+    id (the output of the callback), rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.stats: dict[str, CallbackStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(
+        self, callback_id: str, seconds: float, payload: int | None, error: bool
+    ) -> None:
+        with self._lock:
+            stats = self.stats.get(callback_id)
+            if stats is None:
+                stats = self.stats[callback_id] = CallbackStats()
+            stats.latency.observe(seconds)
+            stats.recent.append(seconds)
+            if payload is not None:
+                stats.payload.observe(payload)
+            if error:
+                stats.errors += 1
+
+    def wrap(self, callback_id: str, func: Callable) -> Callable:
+        """func, timed under callback_id."""
+        if getattr(func, "_recon_metrics", False):
+            return func
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            response = None
+            try:
+                response = func(*args, **kwargs)
+                return response
+            except PreventUpdate:
+                raise
+            except Exception:
+                error = True
+                raise
+            finally:
+                payload = (
+                    len(response.encode()) if isinstance(response, str) else None
+                )
+                self.observe(callback_id, time.perf_counter() - start, payload, error)
+
+        timed._recon_metrics = True
+        return timed
+
+    def quantiles(self, callback_id: str) -> dict[float, float]:
+        """The QUANTILES of the latency of the recent calls of a callback."""
+        with self._lock:
+            recent = list(self.stats[callback_id].recent)
+        return dict(zip(QUANTILES, np.quantile(recent, QUANTILES).tolist()))
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text format."""
+        with self._lock:
+            ids = sorted(self.stats)
+        latency = "recon_callback_duration_seconds"
+        recent = "recon_callback_recent_duration_seconds"
+        payload = "recon_callback_response_bytes"
+        errors = "recon_callback_errors_total"
+        lines = [
+            f"# HELP {latency} Time spent in the callback.",
+            f"# TYPE {latency} histogram",
+        ]
+        for cid in ids:
+            lines += self.stats[cid].latency.lines(latency, _labels(cid))
+        lines += [
+            f"# HELP {recent} Quantiles of the time of the last {RECENT_CALLS} calls.",
+            f"# TYPE {recent} summary",
+        ]
+        for cid in ids:
+            for q, value in self.quantiles(cid).items():
+                lines.append(f'{recent}{{{_labels(cid)},quantile="{q}"}} {value}')
+        lines += [
+            f"# HELP {payload} Size of the JSON response of the callback.",
+            f"# TYPE {payload} histogram",
+        ]
+        for cid in ids:
+            lines += self.stats[cid].payload.lines(payload, _labels(cid))
+        lines += [
+            f"# HELP {errors} Calls of the callback that raised an exception.",
+            f"# TYPE {errors} counter",
+        ]
+        for cid in ids:
+            lines.append(f"{errors}{{{_labels(cid)}}} {self.stats[cid].errors}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(callback_id: str) -> str:
+    escaped = (
+        callback_id.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+    return f'callback="{escaped}"'
+
+
+metrics = CallbackMetrics()
+
+
+def instrument_callbacks(callback_maps: list[dict]) -> int:
+    """
+    Time every callback of the given Dash callback maps (callback id -> spec
+    with the callable under "callback"), e.g. app.callback_map.
+
+    Returns:
+    - The number of callbacks instrumented.
+    """
+    n = 0
+    for callback_map in callback_maps:
+        for callback_id, spec in callback_map.items():
+            spec["callback"] = metrics.wrap(callback_id, spec["callback"])
+            n += 1
+    return n
+
+
+def register_routes(server: Flask, status: Callable[[], dict[str, bool]]) -> None:
+    """
+    Serve the metrics on /metrics, and the readiness of the app on /ready: 200
+    if every check of status passes, 503 otherwise, with the result of each.
+
+    Args:
+    - server: The Flask server of the app.
+    - status: Function returning check name -> whether that cache is warm.
+    """
+
+    def metrics_view() -> Response:
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    def ready_view() -> Response:
+        checks = {name: bool(ok) for name, ok in status().items()}
+        ready = all(checks.values())
+        return Response(
+            json.dumps({"ready": ready, "checks": checks}),
+            status=200 if ready else 503,
+            mimetype="application/json",
+        )
+
+    server.add_url_rule("/metrics", "metrics", metrics_view)
+    server.add_url_rule("/ready", "ready", ready_view)
@@ -0,0 +1,168 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils.cube import get_cube
+from utils.frame_cache import frame_cache, frame_cache_lock
+
+
+def parse_period(period: str) -> tuple[int, int]:
+    """
+    Start and end year of a period written as "YYYY" or "YYYY-YYYY", e.g. the
+    values of common_pers.
+    """
+    parts = str(period).split("-")
+    try:
+        start_yr, end_yr = int(parts[0]), int(parts[-1])
+    except ValueError:
+        raise ValueError(f"not a period of years: {period!r}") from None
+    if len(parts) > 2 or end_yr < start_yr:
+        raise ValueError(f"not a period of years: {period!r}")
+    return start_yr, end_yr
+
+
+@lru_cache(maxsize=32)
+def _membership(
+    periods: tuple[tuple[int, int], ...], first_yr: int, n_years: int
+) -> np.ndarray:
+    years = np.arange(first_yr, first_yr + n_years)
+    weights = np.zeros((len(periods), n_years))
+    for i, (start_yr, end_yr) in enumerate(periods):
+        # Averages are over the whole period, including years without data
+        weights[i, (years >= start_yr) & (years <= end_yr)] = 1 / (
+            end_yr - start_yr + 1
+        )
+    weights.flags.writeable = False
+    return weights
+
+
+def period_matrix(periods: dict[str, str], years: np.ndarray) -> np.ndarray:
+    """
+    Period x year matrix of the weights that turn yearly totals into period
+    averages: 1 / (period length) for the years in a period, 0 elsewhere.
+
+    Args:
+    - periods: Period name -> "YYYY" or "YYYY-YYYY", e.g. common_pers.
+    - years: The consecutive years of the yearly totals.
+    """
+    spans = tuple(parse_period(p) for p in periods.values())
+    first_yr = int(years[0]) if len(years) else 0
+    return _membership(spans, first_yr, len(years))
+
+
+def period_averages(
+    df: pd.DataFrame,
+    var_dict: dict,
+    b_part: str,
+    periods: dict[str, str],
+    yrkind: str = "icy",
+) -> pd.DataFrame:
+    """
+    Average yearly total (TAF) of one variable over each period, for every
+    scenario, from one matrix product of the yearly totals and the period
+    membership matrix. Cached per study DataFrame, variable and periods.
+
+    Args:
+    - df: Study DataFrame.
+    - var_dict: Variable catalog.
+    - b_part: The variable.
+    - periods: Period name -> "YYYY" or "YYYY-YYYY". Besides common_pers, any
+      user-defined periods can be given.
+    - yrkind: "icy" or "iwy", the year the periods refer to.
+
+    Returns:
+    - Scenario x period DataFrame of the averages.
+    """
+    key = (b_part, yrkind, tuple(periods.items()))
+    with frame_cache_lock:
+        cache = frame_cache(df).setdefault("period_averages", {})
+        if key not in cache:
+            cube = get_cube(df, var_dict)
+            years, totals = cube.annual_totals(b_part, yrkind, range(1, 13), taf=True)
+            weights = period_matrix(periods, years)
+            cache[key] = pd.DataFrame(
+                np.nan_to_num(totals) @ weights.T,
+                index=pd.Index(cube.scenarios, name="Scenario"),
+                columns=list(periods),
+            )
+        return cache[key].copy()
+
+
+class PeriodTable:
+    """
+    Annual averages of every variable over a fixed set of named periods, for
+    every scenario and year kind, precomputed with DataCube.range_sum. A summary
+    over a named period is then a lookup.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        var_dict: dict,
+        periods: dict[str, str],
+        yrkinds: tuple[str, ...] = ("iwy", "icy"),
+    ):
+        cube = get_cube(df, var_dict)
+        self.periods = dict(periods)
+        self.spans = {name: parse_period(p) for name, p in self.periods.items()}
+        spans = sorted(set(self.spans.values()))
+        self.tables: dict[tuple[str, int, int], pd.DataFrame] = {}
+        for yrkind in yrkinds:
+            for start_yr, end_yr in spans:
+                # Same arithmetic as make_summary_df over the years, so the
+                # rounded tables are the same
+                totals = cube.range_sum(
+                    yrkind, start_yr, end_yr, range(1, 13), taf=True
+                )
+                n_years = end_yr - start_yr + 1
+                self.tables[(yrkind, start_yr, end_yr)] = totals / n_years
+
+    @classmethod
+    def from_tables(
+        cls, periods: dict[str, str], tables: dict[tuple[str, int, int], pd.DataFrame]
+    ) -> "PeriodTable":
+        """A PeriodTable of tables already computed, e.g. saved by warm_cache.py."""
+        self = cls.__new__(cls)
+        self.periods = dict(periods)
+        self.spans = {name: parse_period(p) for name, p in self.periods.items()}
+        self.tables = dict(tables)
+        return self
+
+    def lookup(self, yrkind: str, start_yr: int, end_yr: int) -> pd.DataFrame | None:
+        """
+        Scenario x variable annual averages (TAF for the converted variables)
+        over start_yr-end_yr, or None if that isn't one of the periods.
+        """
+        return self.tables.get((yrkind, int(start_yr), int(end_yr)))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        All the averages in one long table, for bulk export: one row per year
+        kind, period and scenario, one column per variable.
+        """
+        frames = [
+            self.lookup(yrkind, *self.spans[name])
+            .assign(yrkind=yrkind, period=name, years=period)
+            .reset_index()
+            for yrkind in sorted({key[0] for key in self.tables})
+            for name, period in self.periods.items()
+        ]
+        df = pd.concat(frames, ignore_index=True)
+        keys = ["yrkind", "period", "years", "Scenario"]
+        return df[keys + [col for col in df.columns if col not in keys]]
+
+
+def get_period_table(
+    df: pd.DataFrame, var_dict: dict, periods: dict[str, str]
+) -> PeriodTable:
+    """
+    The PeriodTable of a study DataFrame for a set of named periods, built on
+    first use.
+    """
+    key = tuple(periods.items())
+    with frame_cache_lock:
+        cache = frame_cache(df).setdefault("period_tables", {})
+        if key not in cache:
+            cache[key] = PeriodTable(df, var_dict, periods)
+        return cache[key]
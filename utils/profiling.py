@@ -0,0 +1,169 @@
+import atexit
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from importlib.machinery import SourceFileLoader
+from pathlib import Path
+
+# Set RECON_PROFILE_STARTUP=1 to time the page imports, the data loading stages
+# and the figures built at startup, and print a report at exit. The report is
+# also written as JSON to RECON_PROFILE_STARTUP_FILE, if it is set. tracemalloc
+# slows everything down while profiling, so compare times between profiled runs.
+PROFILE_STARTUP = os.environ.get("RECON_PROFILE_STARTUP", "0") == "1"
+PROFILE_STARTUP_FILE = os.environ.get("RECON_PROFILE_STARTUP_FILE", "")
+
+# Modules timed on import besides those of this repository
+PROFILED_MODULES = ["plotly.express", "pandas", "dash"]
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Top-level modules and packages of this repository. Only these are timed, not
+# everything under REPO_ROOT, which may hold a virtual environment.
+REPO_MODULES = [
+    "app",
+    "navbar",
+    "study_loader",
+    "warm_cache",
+    "charts",
+    "data",
+    "pages",
+    "utils",
+]
+
+
+class StartupProfiler:
+    """
+    Wall time and peak memory (from tracemalloc) of named stages. Stages can be
+    nested, e.g. a page import that loads the data: the times and peaks of the
+    outer stage include the inner ones.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records: list[dict] = []
+        self._stack: list[list] = []
+        self._exec_module = None
+        self._started = None
+
+    def start(self) -> None:
+        """Start recording, and time the imports of the modules of the repo."""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._exec_module = SourceFileLoader.exec_module
+        exec_module = self._exec_module
+        profiler = self
+
+        def profiled_exec_module(loader, module):
+            if not profiler._tracked(module.__name__, loader.path):
+                return exec_module(loader, module)
+            with profiler.stage("import", module.__name__):
+                return exec_module(loader, module)
+
+        SourceFileLoader.exec_module = profiled_exec_module
+
+    def stop(self) -> None:
+        """Stop recording and restore the import machinery."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        SourceFileLoader.exec_module = self._exec_module
+        tracemalloc.stop()
+
+    @staticmethod
+    def _tracked(name: str, path: str) -> bool:
+        if name in PROFILED_MODULES:
+            return True
+        if name.split(".")[0] not in REPO_MODULES:
+            return False
+        try:
+            Path(path).resolve().relative_to(REPO_ROOT)
+        except ValueError:
+            return False
+        return True
+
+    def _fold_peak(self) -> None:
+        # Each stage resets the tracemalloc peak, so the peak so far is kept in
+        # the stages that are still open
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self._stack:
+            frame[1] = max(frame[1], peak)
+
+    @contextmanager
+    def stage(self, kind: str, name: str):
+        """
+        Record the wall time and peak memory of the code in the with block.
+
+        Args:
+        - kind: Group of the stage in the report, e.g. "import", "data", "figure".
+        - name: Name of the stage.
+        """
+        if not self.enabled:
+            yield
+            return
+        self._fold_peak()
+        tracemalloc.reset_peak()
+        start_mem = tracemalloc.get_traced_memory()[0]
+        frame = [start_mem, start_mem]
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._fold_peak()
+            self._stack.pop()
+            self.records.append(
+                {
+                    "kind": kind,
+                    "name": name,
+                    "seconds": seconds,
+                    "peak_mib": (frame[1] - start_mem) / 2**20,
+                    "depth": len(self._stack),
+                }
+            )
+
+    def report(self, top: int | None = None) -> str:
+        """
+        The stages sorted by wall time, slowest first, with the total of the
+        outermost stages.
+        """
+        records = sorted(self.records, key=lambda r: r["seconds"], reverse=True)
+        lines = [f"{'kind':<8} {'seconds':>8} {'peak MiB':>9}  name"]
+        for r in records[:top]:
+            lines.append(
+                f"{r['kind']:<8} {r['seconds']:>8.3f} {r['peak_mib']:>9.1f}  "
+                + "  " * r["depth"]
+                + r["name"]
+            )
+        outer = sum(r["seconds"] for r in self.records if r["depth"] == 0)
+        lines.append(f"Total of the outermost stages: {outer:.3f}s")
+        if self._started is not None:
+            elapsed = time.perf_counter() - self._started
+            lines.append(f"Since profiling started: {elapsed:.3f}s")
+        return "\n".join(lines)
+
+    def dump(self, path: str | Path) -> None:
+        """Write the records as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.records, f, indent=2)
+
+
+profiler = StartupProfiler()
+
+
+def _report_at_exit() -> None:
+    print("Startup profile:")
+    print(profiler.report())
+    if PROFILE_STARTUP_FILE:
+        profiler.dump(PROFILE_STARTUP_FILE)
+
+
+if PROFILE_STARTUP:
+    profiler.start()
+    atexit.register(_report_at_exit)
@@ -1,25 +1,53 @@
+import os
+import threading
+from functools import cache
+
 import pandas as pd
-import yaml
 
-date_map = pd.read_csv("constants/date_map.csv", index_col=0, parse_dates=True)
-df_dv_orig = pd.read_csv("data/dv_data.csv", index_col=0, parse_dates=True)
-df_dv = pd.read_csv("data/dv_data.csv", index_col=0, parse_dates=True)
-scen_aliases = df_dv.Scenario.unique()
+from utils.artifacts import load_artifacts
+from utils.catalog import load_catalog
+from utils.cube import get_cube
+from utils.frame_cache import frame_cache
+from utils.periods import get_period_table
+from utils.profiling import profiler
+from utils.row_index import sort_by_scenario
+from utils.store import compact_frame, read_store
+from utils.tools import (
+    PartialYear,
+    common_pers,
+    extend_partial_years,
+    make_ressum_df,
+    make_summary_df,
+)
 
-with open("constants/dvars.yaml", "r") as file:
-    var_dict = yaml.safe_load(file)
+DV_STORE = "data/dv_data"
+SV_STORE = "data/sv_data"
 
-# DV Derived Timeseries
+# Cached tables saved with the DV artifacts by warm_cache.py
+DV_ARTIFACT_TABLES = {
+    "make_summary_df": make_summary_df,
+    "make_ressum_df": make_ressum_df,
+}
 
-df_dv["SWP_TA_CO_SOD"] = (
-    df_dv["SWP_TA_TOTAL"]
-    - df_dv["SWP_TA_FEATH"]
-    + df_dv["SWP_CO_TOTAL"]
-    - df_dv["SWP_CO_FEATH"]
-)
-df_dv["SWP_CO_SOD"] = df_dv["SWP_CO_TOTAL"] - df_dv["SWP_CO_FEATH"]
+# Set RECON_COMPACT_SCHEMA=1 to hold the data with a categorical Scenario, small
+# integer date columns and float32 values, to cut the memory use of each worker
+COMPACT_SCHEMA = os.environ.get("RECON_COMPACT_SCHEMA", "0") == "1"
+
+date_map = pd.read_csv("constants/date_map.csv", index_col=0, parse_dates=True)
+
+# Special logic for the DCR:
+# The DCR reports calendar year average of 1921 - 2021, but the full range of data
+# does not exist for CY 2021 This logic extends the dataset by three months by
+# averaging the last nine months of data
+# Consistent with how the DCR excel report tool does it
+DCR_PARTIAL_YEARS = {
+    "DCR_21_Hist": PartialYear("2015-01-31 23:59:59", "2015-09-30 23:59:59", 3),
+}
+DCR_PARTIAL_YEAR_DEFAULT = PartialYear("2021-01-31 23:59:59", "2021-09-30 23:59:59", 3)
 
+var_dict = load_catalog("constants/dvars.yaml")
 
+# DV Derived Timeseries
 var_dict["SWP_TA_CO_SOD"] = {
     "alias": "Total SWP Table and Carryover Delivery from the Delta",
     "bpart": "SWP_TA_CO_SOD",
@@ -47,56 +75,7 @@ var_dict["SWP_CO_SOD"] = {
     "type": "Delivery",
 }
 
-# Special logic for the DCR:
-# The DCR reports calendar year average of 1921 - 2021, but the full range of data
-# does not exist for CY 2021 This logic extends the dataset by three months by
-# averaging the last nine months of data
-# Consistent with how the DCR excel report tool does it
-df_dv_extended = pd.DataFrame()
-for s in df_dv["Scenario"].unique():
-    if s == "DCR_21_Hist":
-        start_date_1 = "2015-01-31 23:59:59"
-        end_date_1 = "2015-09-30 23:59:59"
-        new_date_range = pd.date_range(
-            start="2015-10-31 23:59:59", end="2015-12-31 23:59:59", freq="ME"
-        )
-    else:
-        start_date_1 = "2021-01-31 23:59:59"
-        end_date_1 = "2021-09-30 23:59:59"
-        new_date_range = pd.date_range(
-            start="2021-10-31 23:59:59", end="2021-12-31 23:59:59", freq="ME"
-        )
-
-    scenario_df = pd.DataFrame()
-    lastpartialyear = pd.DataFrame()
-    date_range = pd.date_range(
-        start="2021-01-31 23:59:59", end="2021-09-30 23:59:59", freq="ME"
-    )
-
-    scenario_df = df_dv.loc[df_dv["Scenario"] == s]
-    scenario_df.index = pd.to_datetime(scenario_df.index)
-
-    lastpartialyear = scenario_df.loc[
-        (scenario_df.index >= start_date_1) & (scenario_df.index <= end_date_1)
-    ]
-    # This is the average of the last nine months:
-    lastpartialyearavg = lastpartialyear.groupby(["Scenario"]).mean()
-
-    extended_df = pd.concat(
-        [lastpartialyearavg] * len(new_date_range), ignore_index=True
-    )
-    extended_df["Scenario"] = s
-    extended_df.index = new_date_range
-    scenario_df = pd.concat([scenario_df, extended_df])
-    df_dv_extended = pd.concat([df_dv_extended, scenario_df])
-df_dv_extended.update(date_map)
-
-df_dv = pd.DataFrame(df_dv_extended)
-# print(df_dv['icy'])
-
-df_sv = pd.read_csv("data/sv_data.csv", index_col=0, parse_dates=True)
-with open("constants/svars.yaml", "r") as file:
-    svar_dict = yaml.safe_load(file)
+svar_dict = load_catalog("constants/svars.yaml")
 
 # SV Derived Timeseries
 sac_b_map = [
@@ -225,22 +204,158 @@ dpr_i_map = ["I_ELENR", "I_HTCHY", "I_LLOYD", "I_PEDRO"]
 lk_mc_map = ["I_MCLRE"]
 mille_map = ["I_MLRTN"]
 
-df_sv["SAC_B"] = df_sv[sac_b_map].sum(axis=1)
-df_sv["OROVI"] = df_sv[orovi_map].sum(axis=1)
-df_sv["SMART"] = df_sv[smart_map].sum(axis=1)
-df_sv["FOL_I"] = df_sv[fol_i_map].sum(axis=1)
-df_sv["N_MEL"] = df_sv[n_melon_map].sum(axis=1)
-df_sv["DPR_I"] = df_sv[dpr_i_map].sum(axis=1)
-df_sv["LK_MC"] = df_sv[lk_mc_map].sum(axis=1)
-df_sv["MILLE"] = df_sv[mille_map].sum(axis=1)
+# The DataFrames are built on first use, and then shared by every page, so that
+# importing a page doesn't load data that page doesn't need.
+_load_lock = threading.Lock()
+
+
+@cache
+def _load_dv() -> pd.DataFrame:
+    with profiler.stage("data", "dv: read_store"):
+        df_dv = read_store(DV_STORE)
+
+    with profiler.stage("data", "dv: derived timeseries"):
+        df_dv["SWP_TA_CO_SOD"] = (
+            df_dv["SWP_TA_TOTAL"]
+            - df_dv["SWP_TA_FEATH"]
+            + df_dv["SWP_CO_TOTAL"]
+            - df_dv["SWP_CO_FEATH"]
+        )
+        df_dv["SWP_CO_SOD"] = df_dv["SWP_CO_TOTAL"] - df_dv["SWP_CO_FEATH"]
+
+    with profiler.stage("data", "dv: extend_partial_years"):
+        df_dv = extend_partial_years(
+            df_dv, date_map, DCR_PARTIAL_YEARS, default=DCR_PARTIAL_YEAR_DEFAULT
+        )
+    df_dv.index.name = "Date"
+    with profiler.stage("data", "dv: sort_by_scenario"):
+        df_dv = sort_by_scenario(df_dv)
+    if COMPACT_SCHEMA:
+        with profiler.stage("data", "dv: compact_frame"):
+            df_dv = compact_frame(df_dv, name="df_dv")
+    with profiler.stage("data", "dv: load_artifacts"):
+        load_artifacts(df_dv, var_dict, DV_ARTIFACT_TABLES)
+    return df_dv
+
+
+@cache
+def _load_sv() -> pd.DataFrame:
+    with profiler.stage("data", "sv: read_store"):
+        df_sv = read_store(SV_STORE)
+
+    with profiler.stage("data", "sv: derived timeseries"):
+        df_sv["SAC_B"] = df_sv[sac_b_map].sum(axis=1)
+        df_sv["OROVI"] = df_sv[orovi_map].sum(axis=1)
+        df_sv["SMART"] = df_sv[smart_map].sum(axis=1)
+        df_sv["FOL_I"] = df_sv[fol_i_map].sum(axis=1)
+        df_sv["N_MEL"] = df_sv[n_melon_map].sum(axis=1)
+        df_sv["DPR_I"] = df_sv[dpr_i_map].sum(axis=1)
+        df_sv["LK_MC"] = df_sv[lk_mc_map].sum(axis=1)
+        df_sv["MILLE"] = df_sv[mille_map].sum(axis=1)
+
+        df_sv["SAC4"] = (
+            df_sv["SAC_B"] + df_sv["OROVI"] + df_sv["SMART"] + df_sv["FOL_I"]
+        )
+        df_sv["SJR4"] = (
+            df_sv["N_MEL"] + df_sv["DPR_I"] + df_sv["LK_MC"] + df_sv["MILLE"]
+        )
+
+        df_sv["8RI"] = df_sv["SAC4"] + df_sv["SJR4"]
+
+    # Water year types come from the DV data, before it is extended
+    with profiler.stage("data", "sv: read_store WYT_SAC_"):
+        df_sv["WYT_SAC_"] = read_store(DV_STORE, columns=["WYT_SAC_"])["WYT_SAC_"]
+
+    df_sv.index.name = "Date"
+    with profiler.stage("data", "sv: sort_by_scenario"):
+        df_sv = sort_by_scenario(df_sv)
+    if COMPACT_SCHEMA:
+        with profiler.stage("data", "sv: compact_frame"):
+            df_sv = compact_frame(df_sv, name="df_sv")
+    return df_sv
+
+
+@cache
+def _load_scen_aliases():
+    if _load_dv.cache_info().currsize:
+        return _load_dv()["Scenario"].unique()
+    return read_store(DV_STORE, columns=["Scenario"])["Scenario"].unique()
+
 
-df_sv["SAC4"] = df_sv["SAC_B"] + df_sv["OROVI"] + df_sv["SMART"] + df_sv["FOL_I"]
-df_sv["SJR4"] = df_sv["N_MEL"] + df_sv["DPR_I"] + df_sv["LK_MC"] + df_sv["MILLE"]
+def get_dv() -> pd.DataFrame:
+    """
+    The DV DataFrame, with derived timeseries and the DCR extension applied.
+    """
+    with _load_lock:
+        return _load_dv()
 
-df_sv["8RI"] = df_sv["SAC4"] + df_sv["SJR4"]
 
-df_sv["WYT_SAC_"] = df_dv_orig["WYT_SAC_"]
+def get_sv() -> pd.DataFrame:
+    """
+    The SV DataFrame, with the derived basin inflow timeseries.
+    """
+    with _load_lock:
+        return _load_sv()
+
+
+def get_scen_aliases():
+    """
+    The scenario aliases in the DV data, in the order they were loaded.
+    """
+    with _load_lock:
+        return _load_scen_aliases()
+
+
+def cache_status() -> dict[str, bool]:
+    """
+    Which of the data, and of the structures every page needs from it, are in
+    memory. Nothing is loaded, so this can back the readiness check.
+    """
+    dv_loaded = _load_dv.cache_info().currsize > 0
+    sv_loaded = _load_sv.cache_info().currsize > 0
+    dv_cache = frame_cache(_load_dv()) if dv_loaded else {}
+    return {
+        "dv_loaded": dv_loaded,
+        "sv_loaded": sv_loaded,
+        "dv_cube": "cube" in dv_cache,
+        "period_tables": "period_tables" in dv_cache,
+    }
+
+
+def warm_up() -> None:
+    """
+    Load the data and build what cache_status checks, instead of on first use.
+    """
+    df_dv = get_dv()
+    get_sv()
+    get_cube(df_dv, var_dict)
+    get_period_table(df_dv, var_dict, common_pers)
+
+
+_warm_up_thread = None
+
+
+def start_warm_up() -> threading.Thread:
+    """
+    Run warm_up in a background thread, once per process, so that the server
+    starts answering right away and becomes ready when it finishes.
+    """
+    global _warm_up_thread
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+        _warm_up_thread.start()
+    return _warm_up_thread
+
+
+_LAZY_ATTRIBUTES = {
+    "df_dv": get_dv,
+    "df_sv": get_sv,
+    "scen_aliases": get_scen_aliases,
+}
+
 
-# Name indexes
-df_dv.index.name = "Date"
-df_sv.index.name = "Date"
+def __getattr__(name: str):
+    # Keep `from utils.query_data import df_dv` working, without loading at import
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,165 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from utils.frame_cache import frame_cache, frame_cache_lock
+
+
+class RowIndex:
+    """
+    Row positions of a study DataFrame by calendar month, water year type and
+    year, so that filters are set operations on small integer arrays instead of
+    comparisons against whole columns.
+
+    - Each calendar month and WYT maps to the sorted positions of its rows.
+    - Rows are ordered by iwy and by icy, and a year range is found with
+      searchsorted on the sorted years.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.n_rows = len(df)
+        self.groups = {
+            col: self._group(df[col].to_numpy())
+            for col in ["icm", "WYT_SAC_"]
+            if col in df
+        }
+        self.years = {}
+        for yrkind in ["iwy", "icy"]:
+            if yrkind in df:
+                year = df[yrkind].to_numpy()
+                order = np.argsort(year, kind="stable")
+                self.years[yrkind] = (year[order], order)
+
+    @staticmethod
+    def _group(values: np.ndarray) -> dict:
+        # The stable sort keeps the positions in each group in increasing order
+        order = np.argsort(values, kind="stable")
+        keys, starts = np.unique(values[order], return_index=True)
+        stops = [*starts[1:], len(values)]
+        return {
+            key: order[start:stop]
+            for key, start, stop in zip(keys.tolist(), starts, stops)
+        }
+
+    def positions(self, col: str, keys: Iterable) -> np.ndarray:
+        """Positions of the rows whose col is one of keys, like isin."""
+        group = self.groups[col]
+        parts = [group[key] for key in set(keys) if key in group]
+        return np.concatenate(parts) if parts else np.array([], dtype=int)
+
+    def year_range(self, yrkind: str, start_yr: int, end_yr: int) -> np.ndarray:
+        """Positions of the rows with start_yr <= yrkind <= end_yr."""
+        year, order = self.years[yrkind]
+        lo = np.searchsorted(year, start_yr, side="left")
+        hi = np.searchsorted(year, end_yr, side="right")
+        return order[lo:hi]
+
+    def rows(
+        self,
+        months: Iterable[int] | None = None,
+        wyt: Iterable[int] | None = None,
+        yrkind: str = "iwy",
+        start_yr: int | None = None,
+        end_yr: int | None = None,
+    ) -> np.ndarray:
+        """
+        Sorted positions of the rows that pass every given filter, for iloc.
+
+        Args:
+        - months: Calendar months (icm) to keep.
+        - wyt: Water year types (WYT_SAC_) to keep.
+        - yrkind: "iwy" or "icy", the year the range applies to.
+        - start_yr, end_yr: Inclusive year range.
+        """
+        selections = []
+        if months is not None:
+            selections.append(self.positions("icm", months))
+        if wyt is not None:
+            selections.append(self.positions("WYT_SAC_", wyt))
+        if start_yr is not None or end_yr is not None:
+            year = self.years[yrkind][0]
+            selections.append(
+                self.year_range(
+                    yrkind,
+                    year[0] if start_yr is None else start_yr,
+                    year[-1] if end_yr is None else end_yr,
+                )
+            )
+        if not selections:
+            return np.arange(self.n_rows)
+        if len(selections) == 1:
+            return np.sort(selections[0])
+        # Count how many filters each row passes
+        hits = np.zeros(self.n_rows, dtype=np.uint8)
+        for positions in selections:
+            hits[positions] += 1
+        return np.flatnonzero(hits == len(selections))
+
+
+def get_row_index(df: pd.DataFrame) -> RowIndex:
+    """
+    The RowIndex of a study DataFrame, built on first use.
+    """
+    with frame_cache_lock:
+        cache = frame_cache(df)
+        if "row_index" not in cache:
+            cache["row_index"] = RowIndex(df)
+        return cache["row_index"]
+
+
+class ScenarioPartition:
+    """
+    Start/stop offsets of each scenario in a DataFrame whose rows are grouped by
+    scenario (see sort_by_scenario), so a scenario's rows are a zero-copy slice.
+    The offsets also apply to frames with the same rows, e.g. from taf_view.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        values = df["Scenario"].to_numpy()
+        self.n_rows = len(values)
+        change = np.flatnonzero(values[1:] != values[:-1]) + 1
+        starts = [0, *change] if self.n_rows else []
+        stops = [*change, self.n_rows] if self.n_rows else []
+        self.bounds: dict[str, tuple[int, int]] = {}
+        for start, stop in zip(starts, stops):
+            if values[start] in self.bounds:
+                raise ValueError("the rows are not grouped by scenario")
+            self.bounds[values[start]] = (int(start), int(stop))
+        self.scenarios = list(self.bounds)
+
+    def slice(self, df: pd.DataFrame, scenario: str) -> pd.DataFrame:
+        """The rows of one scenario, empty if it isn't in the data."""
+        start, stop = self.bounds.get(scenario, (0, 0))
+        return df.iloc[start:stop]
+
+    def select(self, df: pd.DataFrame, scenarios: Iterable[str]) -> pd.DataFrame:
+        """The rows of several scenarios, in the order of the data, like isin."""
+        scenarios = set(scenarios)
+        parts = [self.slice(df, s) for s in self.scenarios if s in scenarios]
+        return pd.concat(parts) if parts else df.iloc[0:0]
+
+
+def sort_by_scenario(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Group the rows of a DataFrame by scenario, in order of first appearance and
+    keeping the order within each scenario. Already grouped frames are returned
+    as they are.
+    """
+    values = df["Scenario"].to_numpy()
+    runs = values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+    if len(set(runs)) == len(runs):
+        return df
+    codes, _ = pd.factorize(values)
+    return df.iloc[np.argsort(codes, kind="stable")]
+
+
+def get_scenario_partition(df: pd.DataFrame) -> ScenarioPartition:
+    """
+    The ScenarioPartition of a study DataFrame, built on first use.
+    """
+    with frame_cache_lock:
+        cache = frame_cache(df)
+        if "scenarios" not in cache:
+            cache["scenarios"] = ScenarioPartition(df)
+        return cache["scenarios"]
@@ -0,0 +1,64 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from utils.catalog import Catalog
+
+
+class CatalogSearch:
+    """
+    Search-as-you-type index over the bpart, alias and type of every variable in
+    a Catalog. Prefix matches come from a sorted list of the lowercased fields,
+    substring matches from a trigram index.
+    """
+
+    def __init__(self, catalog: Catalog):
+        self.bparts = list(catalog)
+        self._texts = []
+        self.trigrams = defaultdict(set)
+        keys = []
+        for i, (bpart, entry) in enumerate(catalog.items()):
+            texts = {t.lower() for t in (bpart, entry.alias, entry.type) if t}
+            self._texts.append(texts)
+            for text in texts:
+                keys.append((text, i))
+                for j in range(len(text) - 2):
+                    self.trigrams[text[j : j + 3]].add(i)
+        keys.sort()
+        self._keys = [text for text, _ in keys]
+        self._ids = [i for _, i in keys]
+
+    def search(self, query: str, limit: int = 50) -> list[str]:
+        """
+        The bparts of the variables whose bpart, alias or type contains query
+        (case-insensitive). Prefix matches come first, then other substring
+        matches, each in catalog order.
+
+        Args:
+        - query: Text typed by the user.
+        - limit: Maximum number of bparts returned.
+
+        Returns:
+        - List of bparts.
+        """
+        q = query.strip().lower()
+        if not q:
+            return []
+        lo = bisect_left(self._keys, q)
+        hi = bisect_left(self._keys, q + "\uffff")
+        prefix = sorted(set(self._ids[lo:hi]))
+        if len(prefix) >= limit:
+            return [self.bparts[i] for i in prefix[:limit]]
+
+        if len(q) >= 3:
+            candidates = set.intersection(
+                *(self.trigrams.get(q[j : j + 3], set()) for j in range(len(q) - 2))
+            )
+        else:
+            candidates = range(len(self.bparts))
+        seen = set(prefix)
+        substring = sorted(
+            i
+            for i in candidates
+            if i not in seen and any(q in text for text in self._texts[i])
+        )
+        return [self.bparts[i] for i in (prefix + substring)[:limit]]
@@ -0,0 +1,107 @@
+from pathlib import Path
+
+import pandas as pd
+
+# On-disk formats for the study data, in order of preference. Parquet needs
+# pyarrow; CSV is kept as a fallback for environments without it.
+PARQUET = ".parquet"
+CSV = ".csv"
+
+
+def store_path(stem: str | Path) -> Path | None:
+    """
+    Find the data file for a store stem (e.g. "data/dv_data").
+    The Parquet file is used unless the CSV next to it is newer.
+    """
+    stem = Path(stem)
+    parquet = stem.with_suffix(PARQUET)
+    csv = stem.with_suffix(CSV)
+    if parquet.exists():
+        if not csv.exists() or parquet.stat().st_mtime >= csv.stat().st_mtime:
+            return parquet
+    if csv.exists():
+        return csv
+    return None
+
+
+def write_store(df: pd.DataFrame, stem: str | Path) -> Path:
+    """
+    Write a study DataFrame to disk as compressed Parquet, with the Scenario
+    column stored as a categorical. Falls back to CSV if pyarrow is missing.
+
+    Args:
+    - df: DataFrame indexed by date, as built by load_data_mult.
+    - stem: Path to write to, without a suffix.
+
+    Returns:
+    - The path of the file that was written.
+    """
+    stem = Path(stem)
+    df = df.astype({"Scenario": "category"})
+    try:
+        path = stem.with_suffix(PARQUET)
+        df.to_parquet(path, compression="zstd")
+    except ImportError:
+        print("pyarrow is not installed, writing the data as CSV instead")
+        path = stem.with_suffix(CSV)
+        df.to_csv(path)
+    return path
+
+
+def read_store(stem: str | Path, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Read a study DataFrame written by write_store, or a CSV in the same layout.
+
+    Args:
+    - stem: Path to read from, without a suffix.
+    - columns: Optional subset of columns to read, the date index is always kept.
+
+    Returns:
+    - DataFrame indexed by date, with Scenario as a plain string column.
+    """
+    path = store_path(stem)
+    if path is None:
+        raise FileNotFoundError(f"no {PARQUET} or {CSV} data found for {stem}")
+    if path.suffix == PARQUET:
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        usecols = None
+        if columns is not None:
+            # The date index is the first column of the CSV
+            index_col = pd.read_csv(path, nrows=0).columns[0]
+            usecols = [index_col, *columns]
+        df = pd.read_csv(path, index_col=0, parse_dates=True, usecols=usecols)
+    if "Scenario" in df:
+        df["Scenario"] = df["Scenario"].astype(str)
+    return df
+
+
+# Calendar and water year/month columns merged in from constants/date_map.csv
+DATE_COLUMNS = ["icy", "icm", "iwy", "iwm"]
+
+
+def compact_frame(
+    df: pd.DataFrame,
+    float32: bool = True,
+    name: str = "DataFrame",
+) -> pd.DataFrame:
+    """
+    Shrink a study DataFrame in memory: Scenario becomes a categorical, the date
+    columns small integers, and (optionally) the values float32. The values are
+    already rounded to 2 decimals, so float32 keeps them to well within that.
+    The memory use before and after is printed.
+    """
+    before = df.memory_usage(deep=True).sum()
+    types = {"Scenario": "category"}
+    for col in DATE_COLUMNS:
+        if col in df and (df[col] % 1 == 0).all():
+            ints = df[col].astype("int64")
+            types[col] = pd.to_numeric(ints, downcast="integer").dtype
+    if float32:
+        for col in df.columns.difference([*types, "cfs_taf"]):
+            if df[col].dtype == "float64":
+                types[col] = "float32"
+    df = df.astype(types)
+    after = df.memory_usage(deep=True).sum()
+    print(f"{name}: {before / 2**20:,.1f} MiB -> {after / 2**20:,.1f} MiB")
+    return df
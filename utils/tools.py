@@ -1,17 +1,32 @@
 import csv
 import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any, Iterable
 
+import numpy as np
 import pandas as pd
 import pandss as pdss
 import yaml
 
+from utils.catalog import as_catalog
+from utils.cube import TIME_COLUMNS, get_cube
+from utils.frame_cache import frame_cache, frame_cache_lock
+from utils.manifest import Manifest, file_stat, same_stat
+from utils.memo import table_cache
+from utils.periods import get_period_table
+from utils.store import read_store, store_path, write_store
+
 # pd.options.mode.chained_assignment = None
 
 
 # Constants
 monthfilter = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
 
+# Columns kept alongside the values when a DataFrame is projected to a few columns
+KEY_COLUMNS = ["Scenario", *TIME_COLUMNS]
+
 month_map = {
     "Jan": 1,
     "Feb": 2,
@@ -65,6 +80,10 @@ common_pers = {
     "Single Wet Year (2017)": "2017",
 }
 
+# How to complete a partial final year of a scenario: average the months between
+# avg_start and avg_end, and append that average for the next n_months months
+PartialYear = namedtuple("PartialYear", ["avg_start", "avg_end", "n_months"])
+
 # opt = [{"label":k,"value":v} for k,v in common_pers.items()]
 # print(opt)
 
@@ -90,40 +109,295 @@ def convert_wyt_nums(wytchecklist: Iterable[str]) -> list[str]:
     return wytfilter
 
 
-def load_data_mult(scen_dict: dict[str, Any], var_dict: dict, date_map) -> None:
+def _compile_part(part: str) -> str | re.Pattern | None:
+    # DSS pathname parts are case-insensitive; an empty part matches anything
+    if part == "" or part == ".*":
+        return None
+    if re.escape(part) == part:
+        return part.upper()
+    return re.compile(part, re.IGNORECASE)
+
+
+def _part_matches(pattern: str | re.Pattern | None, part: str) -> bool:
+    if pattern is None:
+        return True
+    if isinstance(pattern, str):
+        return pattern == part.upper()
+    return pattern.fullmatch(part) is not None
+
+
+def compile_var_patterns(var_dict: dict) -> tuple[dict, list]:
     """
-    # Load data from the selected DSS files into a .csv
+    Compile the pathname patterns in var_dict for matching against a catalog.
+
+    Returns:
+    - dict of literal (upper case) B parts to a list of (var, parts) patterns
+    - list of (var, parts) patterns whose B part is a regular expression
     """
-    print(scen_dict)
-    dfi = pd.DataFrame()
-    df = pd.DataFrame()
-    appended_data = []
+    by_b = {}
+    wildcard_b = []
+    for var in var_dict:
+        pn = var_dict[var]["pathname"]
+        if pn is None:
+            continue  # Derived timeseries, not read from DSS
+        parts = [_compile_part(p) for p in pn.strip("/").split("/")]
+        if isinstance(parts[1], str):
+            by_b.setdefault(parts[1], []).append((var, parts))
+        else:
+            wildcard_b.append((var, parts))
+    return by_b, wildcard_b
 
-    for s in scen_dict:
-        print(s, scen_dict[s])
-        with pdss.DSS(scen_dict[s]) as dss:
 
-            # Loop to read all paths into DataFrame
-            for var in var_dict:
-                pn = var_dict[var]["pathname"]
-                path_i = pdss.DatasetPath.from_str(pn)
-                print(pn)
+def match_catalog(
+    catalog: Iterable[pdss.DatasetPath],
+    var_dict: dict,
+) -> dict[str, list[pdss.DatasetPath]]:
+    """
+    Resolve every pathname pattern in var_dict against a DSS catalog, in a single
+    pass over the catalog.
 
-                for regular_time_series in dss.read_multiple_rts(path_i):
-                    dfi["Scenario"] = s
-                    dfi[regular_time_series.path.b] = regular_time_series.to_frame()
+    Returns:
+    - dict of var to the catalog paths it matched, in var_dict order
+    """
+    by_b, wildcard_b = compile_var_patterns(var_dict)
+    matched = {var: [] for var in var_dict}
+    for path in catalog:
+        candidates = by_b.get(path.b.upper(), [])
+        if wildcard_b:
+            candidates = candidates + wildcard_b
+        path_parts = (path.a, path.b, path.c, path.d, path.e, path.f)
+        for var, parts in candidates:
+            if all(_part_matches(p, x) for p, x in zip(parts, path_parts)):
+                matched[var].append(path)
+    for paths in matched.values():
+        paths.sort(key=str)
+    return matched
+
+
+def load_scenario(
+    alias: str,
+    pathname: str,
+    var_dict: dict,
+    catalog: list[str] | None = None,
+) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Read every variable in var_dict from one DSS file into a DataFrame.
+    The catalog is read once (or taken from a cached copy), all of the variables
+    are matched against it, and the matched records are read together.
 
-        # Make a list of the DataFrames associated with each DV file
+    Returns:
+    - DataFrame of the variables, with a Scenario column
+    - The catalog of the file, as pathname strings
+    """
+    print(alias, pathname)
+    with pdss.DSS(pathname) as dss:
+        if catalog is None:
+            catalog_paths = list(dss.read_catalog())
+        else:
+            catalog_paths = [pdss.DatasetPath.from_str(p) for p in catalog]
+        matched = match_catalog(catalog_paths, var_dict)
+        missing = [var for var, paths in matched.items() if not paths]
+        if missing:
+            print(f"{alias}: no records found for {missing}")
+        paths = [path for var_paths in matched.values() for path in var_paths]
+        collection = pdss.DatasetPathCollection(paths=set(paths))
+        series = {
+            rts.path.b: rts.to_frame().iloc[:, 0]
+            for rts in dss.read_multiple_rts(collection)
+        }
+
+    # Build the DataFrame in one step, with the columns in var_dict order
+    order = dict.fromkeys(path.b for path in paths)
+    columns = {b: series[b] for b in order if b in series}
+    dfi = pd.DataFrame(columns)
+    dfi.insert(0, "Scenario", alias)
+    return dfi, [str(p) for p in catalog_paths]
+
+
+def unchanged_source(manifest: Manifest, entry: dict, stat: dict) -> bool:
+    """
+    Whether the DSS file of a store entry is the one that was loaded. The file
+    is only hashed if its size or mtime changed since.
+    """
+    if same_stat(entry, stat):
+        return True
+    if entry.get("sha256") is None:
+        return False
+    return manifest.fingerprint(entry["pathname"])["sha256"] == entry["sha256"]
+
+
+def load_data_mult(
+    scen_dict: dict[str, Any],
+    var_dict: dict,
+    date_map,
+    out_path: str = "data/temp",
+    processes: int | None = 1,
+    incremental: bool = False,
+) -> None:
+    """
+    # Load data from the selected DSS files into a Parquet (or .csv) data store
+
+    Each DSS file is independent, so they can be read in parallel: processes is
+    the size of the process pool, None for one process per file (up to the
+    number of CPUs), and 1 to read the files one after another.
+
+    With incremental, scenarios whose DSS file is unchanged since the last load
+    (according to the manifest) are kept from the existing store, and only the
+    variables added to var_dict since then are read for them. If variables were
+    removed from var_dict, every scenario is read again.
+    """
+    print(scen_dict)
+    manifest = Manifest.load()
+    stored = manifest.stores.get(str(out_path), {})
+    existing = None
+    if incremental and stored and store_path(out_path) is not None:
+        existing = read_store(out_path)
+
+    # Work out what needs to be read from each DSS file
+    jobs = {}
+    kept = {}
+    stats = {}
+    for s, pathname in scen_dict.items():
+        stats[s] = file_stat(pathname)
+        entry = stored.get(s)
+        if (
+            existing is not None
+            and entry is not None
+            and entry["pathname"] == pathname
+            and unchanged_source(manifest, entry, stats[s])
+            and set(entry["variables"]) <= set(var_dict)
+        ):
+            kept[s] = existing.loc[existing["Scenario"] == s].drop(
+                columns=date_map.columns.intersection(existing.columns)
+            )
+            new_vars = {v: var_dict[v] for v in var_dict if v not in entry["variables"]}
+            if new_vars:
+                jobs[s] = new_vars
+        else:
+            jobs[s] = var_dict
+    print(f"Reading {list(jobs)}, keeping {[s for s in kept if s not in jobs]}")
+
+    if processes is None:
+        processes = min(len(jobs), os.cpu_count() or 1)
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {
+                s: pool.submit(
+                    load_scenario,
+                    s,
+                    scen_dict[s],
+                    jobs[s],
+                    manifest.catalog(scen_dict[s]),
+                )
+                for s in jobs
+            }
+            loaded = {s: future.result() for s, future in futures.items()}
+    else:
+        loaded = {
+            s: load_scenario(s, scen_dict[s], jobs[s], manifest.catalog(scen_dict[s]))
+            for s in jobs
+        }
+
+    # Make a list of the DataFrames associated with each DV file
+    appended_data = []
+    store_entry = {}
+    for s in scen_dict:
+        variables = list(var_dict)
+        if s in loaded:
+            dfi, catalog = loaded[s]
+            manifest.set_catalog(scen_dict[s], catalog)
+        if s in kept:
+            if s in loaded:
+                dfi = kept[s].join(dfi.drop(columns="Scenario"))
+            else:
+                dfi = kept[s]
+            variables = list(dict.fromkeys(stored[s]["variables"] + variables))
         appended_data.append(dfi)
-        dfi = pd.DataFrame()
+        # Files are only hashed for incremental loads, which compare the hash
+        # when the size or mtime of a file changed
+        sha256 = manifest.fingerprint(scen_dict[s])["sha256"] if incremental else None
+        store_entry[s] = {
+            "pathname": scen_dict[s],
+            **stats[s],
+            "sha256": sha256,
+            "variables": variables,
+        }
 
     # concatenate the individual DataFrames into one big DataFrame
     df = pd.concat(appended_data)
     df = df.round(2)
     df = pd.merge(df, date_map, left_index=True, right_index=True)
-    df.to_csv("data/temp.csv")
+    write_store(df, out_path)
+
+    manifest.stores[str(out_path)] = store_entry
+    manifest.save()
+
 
+def extend_partial_years(
+    df: pd.DataFrame,
+    date_map: pd.DataFrame,
+    partial_years: dict[str, PartialYear | None],
+    default: PartialYear | None = None,
+) -> pd.DataFrame:
+    """
+    Extend each scenario past the end of its data by repeating the average of a
+    window of months, then fill the date columns of the new rows from date_map.
 
+    Args:
+    - df: DataFrame indexed by date, with a Scenario column.
+    - date_map: DataFrame of the date columns (icy, icm, ...), indexed by date.
+    - partial_years: PartialYear to use for each scenario alias.
+    - default: PartialYear for scenarios not in partial_years, None to skip them.
+
+    Returns:
+    - DataFrame with the new rows after the rows of their scenario.
+    """
+    scenarios = df["Scenario"].unique()
+    rules = {s: partial_years.get(s, default) for s in scenarios}
+    rules = {s: r for s, r in rules.items() if r is not None and r.n_months > 0}
+    if not rules:
+        return df
+
+    # Average every scenario's window in a single groupby
+    starts = {s: pd.Timestamp(r.avg_start) for s, r in rules.items()}
+    ends = {s: pd.Timestamp(r.avg_end) for s, r in rules.items()}
+    starts = df["Scenario"].map(starts).to_numpy()
+    ends = df["Scenario"].map(ends).to_numpy()
+    in_window = (df.index >= starts) & (df.index <= ends)
+    window_avg = df.loc[in_window].groupby("Scenario", sort=False, observed=True).mean()
+
+    # Repeat each average for the months after its window
+    n_months = [rules[s].n_months for s in window_avg.index]
+    new_dates = [
+        pd.date_range(
+            pd.Timestamp(rules[s].avg_end) + pd.offsets.MonthEnd(1),
+            periods=rules[s].n_months,
+            freq="ME",
+        )
+        for s in window_avg.index
+    ]
+    extended_df = pd.DataFrame(
+        np.repeat(window_avg.to_numpy(), n_months, axis=0),
+        index=pd.DatetimeIndex(np.concatenate(new_dates), name=df.index.name),
+        columns=window_avg.columns,
+    )
+    extended_df.insert(
+        df.columns.get_loc("Scenario"),
+        "Scenario",
+        np.repeat(window_avg.index.to_numpy(), n_months),
+    )
+    date_cols = date_map.columns.intersection(extended_df.columns)
+    new_date_values = date_map.reindex(extended_df.index)[date_cols]
+    extended_df[date_cols] = new_date_values.fillna(extended_df[date_cols]).to_numpy()
+
+    # Keep the rows of each scenario together, the new rows after the old
+    df = pd.concat([df, extended_df[df.columns]])
+    order = pd.Categorical(df["Scenario"], categories=scenarios).codes
+    return df.iloc[np.argsort(order, kind="stable")]
+
+
+@table_cache(maxsize=64, unordered=["monthfilter"])
 def make_ressum_df(
     scenlist: Iterable[int],
     df: pd.DataFrame,
@@ -132,23 +406,15 @@ def make_ressum_df(
     end_yr=2021,
     monthfilter=monthfilter,
 ) -> pd.DataFrame:
-    df1 = df.loc[
-        (df["icm"].isin(monthfilter)) & (df["iwy"] >= start_yr) & (df["iwy"] <= end_yr)
+    cube = get_cube(df, var_dict)
+    # Only the variables that aren't displayed as water year totals
+    columns = [
+        var
+        for var in cube.variables
+        if var_dict.get(var, {}).get("table_display") != "wy"
     ]
-
-    for i in df1:
-        try:
-            f = var_dict[i]["table_display"]
-            if f == "wy":
-                df1 = df1.drop(columns=i)
-
-        except KeyError:
-            continue
-
-    df_tbl = round(df1.groupby(["Scenario"]).sum() / (end_yr - start_yr + 1))
-
-    # Drop the index columns
-    df_tbl.drop(["icy", "icm", "iwy", "iwm", "cfs_taf"], axis=1, inplace=True)
+    df_tbl = cube.range_sum("iwy", start_yr, end_yr, monthfilter, variables=columns)
+    df_tbl = round(df_tbl / (end_yr - start_yr + 1))
 
     df_tbl = df_tbl.T
     df_tbl["diff"] = df_tbl[scenlist[1]] - df_tbl[scenlist[0]]
@@ -160,18 +426,51 @@ def make_ressum_df(
     return df_tbl
 
 
-def cfs_taf(df: pd.DataFrame, var_dict: dict) -> pd.DataFrame:
+def cfs_taf(
+    df: pd.DataFrame, var_dict: dict, columns: Iterable[str] | None = None
+) -> pd.DataFrame:
+    """
+    Convert the variables with table_convert "cfs_taf" from CFS to TAF.
+
+    Args:
+    - df: DataFrame with a cfs_taf column.
+    - var_dict: Variable definitions.
+    - columns: Only keep and convert these columns, along with Scenario and the
+      date columns. By default every variable in var_dict is converted.
+
+    Returns:
+    - The converted DataFrame.
+    """
+    if columns is not None:
+        keep = [c for c in KEY_COLUMNS if c in df]
+        columns = [c for c in dict.fromkeys(columns) if c not in keep]
+        convert = set(as_catalog(var_dict).by_convert.get("cfs_taf", []))
+        converted = {var: df[var] * df["cfs_taf"] for var in columns if var in convert}
+        return df[keep + columns].assign(**converted)
+
     df_convert = pd.DataFrame(df)
-    for var in var_dict:
-        b = var
-        if var_dict[var]["table_convert"] == "cfs_taf":
-            # print(f'converted {b} to TAF')
-            df_convert[b] = df_convert[b] * df["cfs_taf"]
-        else:
-            continue
+    for b in as_catalog(var_dict).by_convert.get("cfs_taf", []):
+        df_convert[b] = df_convert[b] * df["cfs_taf"]
     return df_convert
 
 
+def taf_view(df: pd.DataFrame, var_dict: dict, columns: Iterable[str]) -> pd.DataFrame:
+    """
+    Same as cfs_taf(df, var_dict, columns), with each column converted only once:
+    the converted columns of a DataFrame are cached and shared by all callers.
+    """
+    keep = [c for c in KEY_COLUMNS if c in df]
+    columns = [c for c in dict.fromkeys(columns) if c not in keep]
+    with frame_cache_lock:
+        view = frame_cache(df).setdefault("taf", {})
+        for var in columns:
+            if var not in view:
+                view[var] = cfs_taf(df, var_dict, [var])[var]
+        converted = {var: view[var] for var in columns}
+    return df[keep].assign(**converted)
+
+
+@table_cache(maxsize=64, unordered=["monthfilter"])
 def make_summary_df(
     scenlist: list[int],
     df: pd.DataFrame,
@@ -183,46 +482,40 @@ def make_summary_df(
     bparts=None,
 ) -> pd.DataFrame:
 
-    df1 = df.loc[
-        (df["icm"].isin(monthfilter)) &
-        (df[yrkind] >= start_yr) &
-        (df[yrkind] <= end_yr)
-    ]
-    columns_to_drop = [col for col in df1.columns if "S_" in col]
-    df1 = df1.drop(columns=columns_to_drop)
-    # Do Conversions
-    for var in var_dict:
-        if var_dict[var]["table_convert"] == "cfs_taf":
-            df1[var] = df1[var] * df1["cfs_taf"]
-        else:
-            continue
-
-    # Annual Average
-    df_tbl = round(df1.groupby(["Scenario"]).sum() / (end_yr - start_yr + 1))
-
-    # Time slicing is done; drop the index columns
-    df_tbl.drop(["icy", "icm", "iwy", "iwm", "cfs_taf"], axis=1, inplace=True)
-
-    # Filter B-Parts, if user-specified
+    # Storage (S_) variables aren't summed, and only the user-specified B-Parts
+    # are computed
+    cube = get_cube(df, var_dict)
+    columns = [col for col in cube.variables if "S_" not in col]
     if bparts is not None:
-        df1 = df_tbl.loc[:, bparts]
-        df_tbl = df1
-
-    # Make a dictionary of just aliases to map to the dataframe
-    alias_dict = {}
-    type_dict = {}
-    convert_dict = {}
-    for key in var_dict:
-        alias_dict[key] = var_dict[key]["alias"]
-        type_dict[key] = var_dict[key]["type"]
-        convert_dict[key] = "TAF/Yr" \
-            if var_dict[key]["table_convert"] == 'cfs_taf' else ''
+        missing = [b for b in bparts if b not in columns]
+        if missing:
+            raise KeyError(f"{missing} not in the summary variables")
+        columns = list(bparts)
+
+    # Annual Average, in TAF for the variables converted by cfs_taf. Whole years
+    # over a named period are looked up in the precomputed period table
+    df_tbl = None
+    if set(monthfilter) == set(range(1, 13)):
+        df_tbl = get_period_table(df, var_dict, common_pers).lookup(
+            yrkind, start_yr, end_yr
+        )
+    if df_tbl is not None:
+        df_tbl = round(df_tbl[columns])
+    else:
+        df_tbl = cube.range_sum(
+            yrkind, start_yr, end_yr, monthfilter, taf=True, variables=columns
+        )
+        df_tbl = round(df_tbl / (end_yr - start_yr + 1))
 
+    catalog = as_catalog(var_dict)
+    units = catalog.field("table_convert")
     df_tbl = df_tbl.T
     # Add index columns
-    df_tbl["description"] = df_tbl.index.map(alias_dict)
-    df_tbl["type"] = df_tbl.index.map(type_dict)
-    df_tbl["convert"] = df_tbl.index.map(convert_dict)
+    df_tbl["description"] = df_tbl.index.map(catalog.field("alias"))
+    df_tbl["type"] = df_tbl.index.map(catalog.field("type"))
+    df_tbl["convert"] = df_tbl.index.map(
+        lambda b: ("TAF/Yr" if units[b] == "cfs_taf" else "") if b in units else np.nan
+    )
     # Calculate tables
     df_tbl["diff"] = df_tbl[scenlist[1]].sub(
         df_tbl[scenlist[0]],
@@ -325,7 +618,8 @@ def remove_duplicates(data: dict) -> dict:
 
 def list_files(directory: str) -> dict[str, str]:
     """
-    List all files in a directory including those within nested folders.
+    List all DSS files in a directory including those within nested folders.
+    Directories that haven't changed since the last call are not re-scanned.
 
     Args:
     - directory (str): The path to the directory to list files from.
@@ -333,14 +627,8 @@ def list_files(directory: str) -> dict[str, str]:
     Returns:
     - dict: A dictionary of file paths
     """
-    # TODO: 2024-07-15 Replace this with pathlib objects
-    file_paths = {}  # List to store all file paths
-    # Traverse directory tree
-    for root, directories, files in os.walk(directory):
-        for filename in files:
-            filepath = os.path.join(root, filename)
-            parts = filename.split("\\")
-            # print(filename.split('.')[-1])
-            if filename.split(".")[-1] == "dss":
-                file_paths[parts[-1]] = filepath
+    manifest = Manifest.load()
+    file_paths = manifest.scan(directory, ".dss")
+    if manifest.changed:
+        manifest.save()
     return file_paths
@@ -0,0 +1,84 @@
+"""
+Precompute the default state of the app from the data stores, so that server
+processes load it instead of building it on first use:
+
+- the period tables and the summary tables shown by default of the DV data
+  (data/artifacts, memory-mapped by the server processes)
+- every card and period figure (data/figures)
+
+Artifacts of older data are deleted, and so are the cached figures it neither
+built nor read: those of older data or code. Run it after study_loader.py,
+whenever the data changes, e.g.
+
+    python warm_cache.py --dv data/dv_data --sv data/sv_data
+"""
+
+import argparse
+import time
+
+# Months shown by the default drilldown reservoir summary
+RESSUM_MONTHS = [9]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Precompute the default state of the app from the data stores."
+    )
+    parser.add_argument("--dv", help="DV data store, without a suffix")
+    parser.add_argument("--sv", help="SV data store, without a suffix")
+    parser.add_argument("--artifact-dir", help="Directory for the precomputed data")
+    parser.add_argument("--figure-dir", help="Directory for the cached figures")
+    return parser.parse_args()
+
+
+def warm(args: argparse.Namespace) -> None:
+    import utils.artifacts as artifacts
+    import utils.figure_cache as figure_cache
+    import utils.query_data as query_data
+
+    if args.dv:
+        query_data.DV_STORE = args.dv
+    if args.sv:
+        query_data.SV_STORE = args.sv
+    if args.artifact_dir:
+        artifacts.ARTIFACT_DIR = args.artifact_dir
+    if args.figure_dir:
+        figure_cache.FIGURE_CACHE_DIR = args.figure_dir
+
+    # The pages are registered with the app, importing it imports all of them
+    import dash
+
+    import app  # noqa: F401
+    from utils.periods import get_period_table
+    from utils.tools import common_pers, make_ressum_df, make_summary_df
+
+    var_dict = query_data.var_dict
+    t = time.perf_counter()
+    df_dv = query_data.get_dv()
+    query_data.get_sv()
+    scens = query_data.get_scen_aliases()
+    print(f"Loaded the data in {time.perf_counter() - t:.1f}s")
+
+    # Every page in its default state, which builds the card figures and the
+    # tables they use
+    t = time.perf_counter()
+    get_period_table(df_dv, var_dict, common_pers)
+    for page in dash.page_registry.values():
+        layout = page["layout"]
+        if callable(layout):
+            layout()
+    # Default drilldown summary tables, which aren't built by its layout
+    make_summary_df(scens, df_dv, var_dict)
+    make_ressum_df(scens, df_dv, var_dict, monthfilter=RESSUM_MONTHS)
+    print(f"Built the pages in {time.perf_counter() - t:.1f}s")
+
+    path = artifacts.save_artifacts(df_dv, var_dict, query_data.DV_ARTIFACT_TABLES)
+    print(f"Saved {path}")
+    for stale in artifacts.prune_artifacts(keep=[path]):
+        print(f"Deleted {stale}")
+    for stale in figure_cache.prune_figures(keep=figure_cache.used_figures()):
+        print(f"Deleted {stale}")
+
+
+if __name__ == "__main__":
+    warm(parse_args())